@@ -0,0 +1,48 @@
+"""
+Numeric kernels of the portfolio, kept apart so that importing portfolio does not pay for importing numba;
+this module is only imported by the first Portfolio.update.
+"""
+import numpy as np
+try:
+    from numba import njit
+except ImportError:  # numba is optional, without it the kernels run as plain numpy code
+    njit = None
+
+
+def _compute_position_deltas_numpy(quantity, buy_price, last_update_price, new_price):
+    """
+    Change metrics of all positions for a vector of new prices (one entry per position).
+
+    Returns:
+        (absolute_change_since_start, relative_change_since_start,
+         absolute_change_since_update, relative_change_since_update)
+    """
+    absolute_change_since_start = (new_price - buy_price) * quantity
+    relative_change_since_start = (new_price - buy_price) / buy_price
+    absolute_change_since_update = (new_price - last_update_price) * quantity
+    relative_change_since_update = (new_price - last_update_price) / last_update_price
+    return (absolute_change_since_start, relative_change_since_start,
+            absolute_change_since_update, relative_change_since_update)
+
+
+def _compute_position_deltas_loop(quantity, buy_price, last_update_price, new_price):
+    """Same as _compute_position_deltas_numpy, as one fused pass over the positions for numba to compile."""
+    n = quantity.shape[0]
+    absolute_change_since_start = np.empty(n)
+    relative_change_since_start = np.empty(n)
+    absolute_change_since_update = np.empty(n)
+    relative_change_since_update = np.empty(n)
+    for i in range(n):
+        change_since_start = new_price[i] - buy_price[i]
+        change_since_update = new_price[i] - last_update_price[i]
+        absolute_change_since_start[i] = change_since_start * quantity[i]
+        relative_change_since_start[i] = change_since_start / buy_price[i]
+        absolute_change_since_update[i] = change_since_update * quantity[i]
+        relative_change_since_update[i] = change_since_update / last_update_price[i]
+    return (absolute_change_since_start, relative_change_since_start,
+            absolute_change_since_update, relative_change_since_update)
+
+
+# Compiled on first call; cache=True stores the machine code in __pycache__, so later processes skip the JIT warm-up
+compute_position_deltas = (_compute_position_deltas_numpy if njit is None
+                           else njit(cache=True, fastmath=True)(_compute_position_deltas_loop))
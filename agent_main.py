@@ -1,79 +1,130 @@
-from portfolio import Portfolio, Position, Transaction
+from portfolio import Portfolio
+import market
 
-from jinja2 import Template
-import faiss
 import inspect
-from typing import Optional
+import copy
+from concurrent.futures import ThreadPoolExecutor
+import os
 import json
 from news import NewsApiCustomClient, WorldNewsCustomClient
 from datetime import datetime
-import yaml
+import functools
 from typing import Dict, Any, List, Optional
 from pathlib import Path
+from pydantic_core import from_json
 
 from memory.memorymodel import Episode, Experience, Reflection, ReflectionOutput, Perception, Action, ActionType
 from memory.stores import MemoryController
-from llm_utils import query_llm_with_tools, query_llm_with_structured_output
-
-setting_prompt = str("You are a trading bot and financial expert.\n\n"
-    "Your goal is to maximize your portfolio's value.\n"
-    "Your current plan is: Buy shares when the news indicate a good buying opportunity, sell shares when the news indicate upcoming falling prices.\n"
-    "You make memories while trading. Each memory contains two parts:"
-    "the 'Experience'-part encompassing"
-    "(A1) the news of the day"
-    "(A2) the trading decision you made [BUY, SELL, WAIT]"
-    "(A3) your portfolio at the time (after executing the trading decision)"
-    "(A4) a statement on your expectations at the time\n\n"
-    "Additionally a memory has a 'Reflection'-part encompassing"
-    "(B1) an evaluation of your expectation at a later timestamp"
-    "(B2) a learning, drawn from comparing the expectation with it's evaluation. The goal is to draw helpful learnings that increase your trading abilities in the future")
-    
+from llm_utils import query_llm_with_tools, query_llm_with_structured_output, SemanticCache, PromptCache, lazy_import
+
+# YAML is only needed for the human-readable config (create_new, first load, export); the per-tick state is JSON
+yaml = lazy_import("yaml")
+
+def _yaml_loader():
+    """libyaml's C loader if PyYAML was built with it, else the pure-Python one."""
+    return getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+def _yaml_dumper():
+    return getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+@functools.cache
+def _round_trip_yaml():
+    """Optional: ruamel.yaml's round-trip mode keeps comments, quoting and key order of a hand-edited config across saves."""
+    try:
+        from ruamel.yaml import YAML
+    except ImportError:
+        return None
+    round_trip_yaml = YAML(typ='rt')
+    round_trip_yaml.preserve_quotes = True
+    return round_trip_yaml
+
+def _merge_into(document, data):
+    """Recursively update a round-trip YAML document with data, so comments on unchanged keys survive."""
+    if not isinstance(document, dict) or not isinstance(data, dict):
+        return data
+    for key in list(document):
+        if key not in data:
+            del document[key]
+    for key, value in data.items():
+        document[key] = _merge_into(document.get(key), value)
+    return document
+
+setting_prompt = """\
+You are a trading bot and financial expert.
+
+Your goal is to maximize your portfolio's value.
+Your current plan is: Buy shares when the news indicate a good buying opportunity, sell shares when the news indicate upcoming falling prices.
+You make memories while trading. Each memory contains two parts:
+the 'Experience'-part encompassing
+(A1) the news of the day
+(A2) the trading decision you made [BUY, SELL, WAIT]
+(A3) your portfolio at the time (after executing the trading decision)
+(A4) a statement on your expectations at the time
+
+Additionally a memory has a 'Reflection'-part encompassing
+(B1) an evaluation of your expectation at a later timestamp
+(B2) a learning, drawn from comparing the expectation with it's evaluation. The goal is to draw helpful learnings that increase your trading abilities in the future
+"""
+
+# Each flow is split into a static system prompt (identical on every call, so providers can serve it
+# from their prompt-prefix cache) and a user prompt template carrying all per-call data.
+
 # Flow 1 Prompt: "Learning" = run_reflection
-flow_1_prompt_template = Template(
-    "{{setting_prompt}}"
-    "You are now given the opportunity to reflect on your latest action."
-    "Your latest memory's 'Experience'-part is\n"
-    "{{latest_memory}}\n\n"
-    "Today's state of your Portfolio is\n"
-    "{{portfolio}}\n"
-    "{{transaction_history}}\n\n"
-    "You must now verbalize the following to complete the memory's 'Reflection'-part:\n"
-    "- An evaluation of your previous expectation: Given the now available information of your portfolio's development, "
-    "ask yourself: 'Did things happen in the way you predicted them?'\n"
-    "- A learning: A short statement that draws a conclusion from the experience that may be helpful for similar future situations.\n\n"
-    "Provide your answer in this JSON format:\n"
-    "{\n"
-    "    \"evaluation\": str,\n"
-    "    \"learning\": str\n"
-    "}"
-)
+flow_1_system_prompt = setting_prompt + """
+You are now given the opportunity to reflect on your latest action.
+You will be given your latest memory's 'Experience'-part and today's state of your portfolio.
+
+You must now verbalize the following to complete the memory's 'Reflection'-part:
+- An evaluation of your previous expectation: Given the now available information of your portfolio's development, ask yourself: 'Did things happen in the way you predicted them?'
+- A learning: A short statement that draws a conclusion from the experience that may be helpful for similar future situations.
+
+Provide your answer in this JSON format:
+{
+    "evaluation": str,
+    "learning": str
+}"""
+
+def build_flow_1_prompt(latest_memory: str, portfolio: str, transaction_history: str) -> str:
+    return f"""\
+Your latest memory's 'Experience'-part is
+{latest_memory}
+
+Today's state of your Portfolio is
+{portfolio}
+{transaction_history}"""
 
 # Flow 2 Prompt: "Trading" = run_action
-flow_2_prompt_template = Template(
-    "{{setting_prompt}}"
-    "It is {{ current_date.strftime('%A, %d of %B') }}\n"
-    "Keep in mind the weekend as the exchanges are closed on Saturday and Sunday. "
-    "As such, we do not expect any price changes during those days.\n\n"
-    "Your current state is\n"
-    "{{portfolio}}\n"
-    "{{transaction_history}}\n\n"
-    "You are currently trading on these symbols\n"
-    "{{symbols_of_interest}}\n\n"
-    "Today's news summaries for the symbols:\n"
-    "{{news_summaries}}\n\n"
-    "With regard to the latest news, you remember the following experiences, "
-    "which you - at the time - had also reflected upon and drew some learnings:\n"
-    "{{memories}}\n\n"
-    "Today, you already did the following trades:\n\n"
-    "You may now choose your next action:\n"
-    "- buy symbol :: see tool description\n"
-    "- sell symbol :: see tool description\n"
-    "- wait :: see tool description\n\n"
-    "When selling or buying stocks, keep in mind some price fluctuation. "
-    "A request to sell 100€ of a 100€ position may not be filled "
-    "if the position's value has suddenly decreased by a bit in the meantime.\n"
-    "You can always close positions safely via close_position."
-)
+flow_2_system_prompt = setting_prompt + """
+Keep in mind the weekend as the exchanges are closed on Saturday and Sunday. As such, we do not expect any price changes during those days.
+
+You will be given your current state, the symbols you are trading on, today's news and your memories of similar situations.
+You may then choose your next action:
+- buy symbol :: see tool description
+- sell symbol :: see tool description
+- wait :: see tool description
+
+When selling or buying stocks, keep in mind some price fluctuation. A request to sell 100€ of a 100€ position may not be filled if the position's value has suddenly decreased by a bit in the meantime.
+You can always close positions safely via close_position."""
+
+def build_flow_2_prompt(current_date: str, portfolio: str, transaction_history: str, symbols_of_interest: str,
+                        news_summaries: str, memories: str) -> str:
+    return f"""\
+It is {current_date}
+
+Your current state is
+{portfolio}
+{transaction_history}
+
+You are currently trading on these symbols
+{symbols_of_interest}
+
+Today's news summaries for the symbols:
+{news_summaries}
+
+With regard to the latest news, you remember the following experiences, which you - at the time - had also reflected upon and drew some learnings:
+{memories}
+
+Today, you already did the following trades:"""
 
 
 
@@ -115,7 +166,8 @@ example_episode = {
 }
 
     
-action_flow_tools = [
+# Read-only tuple shared by all calls; the entries stay plain dicts, which is what the OpenAI client serializes
+action_flow_tools = (
     {
         "type": "function",
         "function": {
@@ -197,78 +249,224 @@ action_flow_tools = [
             }
         }
     }
-]
+)
+action_flow_tool_names = frozenset(tool["function"]["name"] for tool in action_flow_tools)
+# Parameters accepted by the Portfolio method behind each tool, so tool calls are filtered without inspecting per call
+action_flow_tool_params = {name: frozenset(inspect.signature(getattr(Portfolio, name)).parameters) - {"self"}
+                           for name in action_flow_tool_names}
 
         
 
     
     
+def deduplicate_lines(text: str) -> str:
+    """
+    Drop repeated lines (e.g. a headline both news sources or several symbols report), keeping the first occurrence.
+    Single empty lines are kept, so the paragraphs of the summaries stay separated.
+    """
+    seen = set()
+    lines = []
+    for line in text.splitlines():
+        key = line.strip().casefold()
+        if key:
+            if key in seen:
+                continue
+            seen.add(key)
+        elif lines and not lines[-1].strip():
+            continue  # the paragraph in between was dropped completely
+        lines.append(line)
+    return "\n".join(lines)
+
+
+@functools.cache
+def shared_news_clients():
+    """News clients shared by all agents of the process, so their pooled connections are reused across agents and ticks."""
+    return NewsApiCustomClient(), WorldNewsCustomClient()
+
+
 class Agent:
     def __init__(self, config_path: str):
         """
         Initialize agent state from a YAML config file.
         
         Args:
-            config_path: Path to the agent state YAML file
+            config_path: Path to the agent state YAML (or JSON) file
         """
         self.config_path = Path(config_path)
+        # The state is persisted as JSON next to the YAML config; the YAML is only read when it is newer
+        self.state_path = self.config_path if self.config_path.suffix == '.json' else self.config_path.with_suffix('.json')
+        self.metrics_path = self.state_path.with_suffix('.metrics.json')
         self.portfolio = None
         self.current_episode = None
         self.memory_controller = None   
         self.state_data = self.load_state()
-        self.news_client = NewsApiCustomClient()
-        self.world_news_client = WorldNewsCustomClient()
+        # Static config values, looked up once instead of on every property access
+        self._agent_name = self.state_data['agent_config']['name']
+        self._symbols_of_interest = self.state_data['symbols_of_interest']
+        self._file_paths = self.state_data['files']
+        self.news_client, self.world_news_client = shared_news_clients()
+        # News requests are latency-bound, so they are issued concurrently (both clients, all symbols)
+        self._news_executor = ThreadPoolExecutor(max_workers=20, thread_name_prefix="news")
+        self._news_prefetch = None
+        # A single writer thread keeps saves in order while the next tick already runs
+        self._save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="save")
+        self._save_future = None
+        # Optional semantic LLM response caches (one per flow), enabled by setting agent_config.llm_cache_threshold
+        llm_cache_threshold = self.state_data['agent_config'].get('llm_cache_threshold')
+        self.action_llm_cache = SemanticCache(threshold=llm_cache_threshold) if llm_cache_threshold else None
+        self.reflection_llm_cache = SemanticCache(threshold=llm_cache_threshold) if llm_cache_threshold else None
+        # Optional persistent cache of exact prompt repeats (e.g. backtests), enabled by setting agent_config.prompt_cache
+        self.prompt_cache = None
+        if self.state_data['agent_config'].get('prompt_cache'):
+            self.prompt_cache = PromptCache(self._file_paths.get('prompt_cache', self.state_path.parent / 'prompt_cache'))
         
         
     def load_state(self) -> Dict[str, Any]:
-        """Load the agent state from YAML file."""
-        if not self.config_path.exists():
+        """Load the agent state from its JSON state file, or from the YAML config on first load and after it was edited."""
+        try:
+            with open(self.state_path, 'rb') as f:
+                state_mtime = os.fstat(f.fileno()).st_mtime
+                state = json.load(f)
+        except FileNotFoundError:
+            state, state_mtime = None, None
+        from_yaml = False
+        if self.config_path != self.state_path:
+            try:
+                from_yaml = state is None or os.stat(self.config_path).st_mtime > state_mtime
+            except FileNotFoundError:
+                pass
+        if from_yaml:
+            with open(self.config_path, 'rb') as f:
+                state_mtime = os.fstat(f.fileno()).st_mtime
+                round_trip_yaml = _round_trip_yaml()
+                if round_trip_yaml is not None:
+                    state = round_trip_yaml.load(f)
+                else:
+                    state = yaml.load(f, Loader=_yaml_loader())
+        if state is None:
             raise FileNotFoundError(f"Config file not found: {self.config_path}")
-            
-        with open(self.config_path, 'r') as f:
-            state = yaml.safe_load(f)
+
+        # Metrics written after the state file was last saved (or edited) live in the metrics sidecar
+        try:
+            with open(self.metrics_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_mtime >= state_mtime:
+                    sidecar = json.load(f)
+                    state['last_run'] = sidecar['last_run']
+                    state.setdefault('metrics', {}).update(sidecar['metrics'])
+        except FileNotFoundError:
+            pass
             
         # Load associated portfolio if exists
-        portfolio_path = Path(state['files']['portfolio'])
-        if portfolio_path.exists():
-            self.portfolio = Portfolio.from_file(str(portfolio_path))
+        try:
+            self.portfolio = Portfolio.from_file(state['files']['portfolio'])
+        except FileNotFoundError:
+            pass
         
-        # Load associated memory data if exists
-        if portfolio_path.exists():
-            self.memory_controller = MemoryController(agent_name=state['agent_config']['name'])
+        # Load associated memory data; the controller opens existing stores and creates missing ones,
+        # so it does not depend on whether a portfolio file was found
+        agent_config = state['agent_config']
+        self.memory_controller = MemoryController(agent_name=agent_config['name'],
+                                                  index_factory=agent_config.get('memory_index', 'Flat'),
+                                                  ann_index_factory=agent_config.get('memory_ann_index'),
+                                                  ann_threshold=agent_config.get('memory_ann_threshold', 1000),
+                                                  nprobe=agent_config.get('memory_nprobe', 8),
+                                                  embedding_dtype=agent_config.get('embedding_dtype', 'float32'),
+                                                  embedding_model=agent_config.get('embedding_model', 'text-embedding-3-small'),
+                                                  exact_search_threshold=agent_config.get('memory_exact_search_threshold', 2048),
+                                                  ef_search=agent_config.get('memory_ef_search', 64),
+                                                  file_paths=state['files'])
         
-        print(f"Agent: loaded state from {self.config_path} as {state}")
+        # State read from YAML is written to the JSON state file on the next save
+        self._saved_state_hash = None if from_yaml else self.hash_state(state)
+        print(f"Agent: loaded state from {self.config_path if from_yaml else self.state_path} as {state}")
         return state
-    
+
+    def export(self):
+        """Write the current state to the human-readable YAML config, keeping its comments if ruamel.yaml is installed."""
+        if self.config_path == self.state_path:
+            return
+        tmp_path = self.config_path.with_suffix('.yaml.tmp')
+        round_trip_yaml = _round_trip_yaml()
+        if round_trip_yaml is not None:
+            try:
+                with open(self.config_path, 'rb') as f:
+                    document = round_trip_yaml.load(f)
+            except FileNotFoundError:
+                document = None
+            with open(tmp_path, 'w') as f:
+                round_trip_yaml.dump(_merge_into(document, self.state_data), f)
+        else:
+            with open(tmp_path, 'w') as f:
+                yaml.dump(self.state_data, f, Dumper=_yaml_dumper(), default_flow_style=False, sort_keys=False)
+        os.replace(tmp_path, self.config_path)
+
+    @staticmethod
+    def hash_state(state: Dict[str, Any]) -> int:
+        """Hash of the state content except the metrics and the 'last_run' timestamp, which go to the metrics sidecar."""
+        return hash(json.dumps({k: v for k, v in state.items() if k not in ('last_run', 'metrics')}, sort_keys=True, default=str))
+
     def save_state(self):
-        """Save the current state to YAML file."""
+        """
+        Update the metrics and save the state and portfolio files.
+        The files are written by a background thread from snapshots taken here; wait_for_save() blocks until they are on disk.
+        """
         # Update metrics
-        self.state_data['last_run'] = datetime.now().isoformat()
-        self.state_data['metrics']['memories'] = len(self.memory_controller.memory_index.db)
+        self.state_data['metrics']['memories'] = self.memory_controller.get_memory_count()
         self.state_data['metrics']['portfolio_value'] = self.portfolio.portfolio_value
         self.state_data['metrics']['total_trades'] = len(self.portfolio.transaction_history)
 
-        # Save main state file
-        with open(self.config_path, 'w') as f:
-            yaml.dump(self.state_data, f, default_flow_style=False, sort_keys=False)
-            
-        # Save portfolio if it exists
-        self.portfolio.to_file(self.state_data['files']['portfolio'])
+        # Save the main state file only when its static part changed; 'last_run' and the metrics, which change on
+        # every tick, are written to the small metrics sidecar
+        state_snapshot = None
+        self.state_data['last_run'] = datetime.now().isoformat()
+        metrics_snapshot = {'last_run': self.state_data['last_run'], 'metrics': copy.deepcopy(self.state_data['metrics'])}
+        state_hash = self.hash_state(self.state_data)
+        if state_hash != self._saved_state_hash:
+            state_snapshot = copy.deepcopy(self.state_data)
+            self._saved_state_hash = state_hash
+
+        # Save portfolio; a files.portfolio path ending in .pkl selects the faster binary format
+        portfolio_data = self.portfolio.dumps(binary=Portfolio.is_binary_file(self._file_paths['portfolio']))
+        self._save_future = self._save_executor.submit(self._write_state_files, state_snapshot, metrics_snapshot, portfolio_data)
+
+    def _write_state_files(self, state_snapshot: Optional[Dict[str, Any]], metrics_snapshot: Dict[str, Any],
+                           portfolio_data: bytes):
+        # Write to temporary files first, so a crash mid-write never corrupts the only state file
+        if state_snapshot is not None:
+            tmp_path = self.state_path.with_suffix('.json.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(state_snapshot, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+        tmp_path = self.metrics_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(metrics_snapshot, f, indent=2)
+        os.replace(tmp_path, self.metrics_path)
+        portfolio_path = self.state_data['files']['portfolio']
+        tmp_path = f"{portfolio_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(portfolio_data)
+        os.replace(tmp_path, portfolio_path)
+
+    def wait_for_save(self):
+        """Block until the last save_state call has written its files (re-raising any error of the write)."""
+        if self._save_future is not None:
+            self._save_future.result()
+            self._save_future = None
     
     @property
     def agent_name(self) -> str:
         """Get agent name."""
-        return self.state_data['agent_config']['name']
+        return self._agent_name
     
     @property
     def symbols_of_interest(self) -> List[str]:
         """Get list of symbols the agent is interested in."""
-        return self.state_data['symbols_of_interest']
+        return self._symbols_of_interest
     
     @property
     def file_paths(self) -> Dict[str, str]:
         """Get dictionary of all file paths."""
-        return self.state_data['files']
+        return self._file_paths
     
     def get_metric(self, metric_name: str) -> Optional[Any]:
         """Get a specific metric value."""
@@ -310,13 +508,22 @@ class Agent:
             'created_at': datetime.now().isoformat(),
             'last_run': datetime.now().isoformat(),
             'agent_config': {
-                'name': agent_name
+                'name': agent_name,
+                'memory_index': 'SQfp16',
+                'memory_ann_index': 'IVF{nlist},PQ{m}',
+                'embedding_dtype': 'float16',
+                # Far above the exact-search threshold: small memories are searched exactly, and PQ has enough training points
+                'memory_ann_threshold': 20000,
+                'memory_nprobe': 8,
+                'embedding_model': 'text-embedding-3-small',
+                'prefetch': True
             },
             'files': {
                 'portfolio': str(agent_dir / 'portfolio.json'),
-                'memory_index': str(agent_dir / 'memory_index.json'),
+                'memory_mapping': str(agent_dir / 'memory_mapping.sqlite'),
                 'memory_embeddings': str(agent_dir / 'faiss_index.bin'),
-                'current_episode_store': str(agent_dir / 'current_episode_store.json')
+                'embeddings_cache': str(agent_dir / 'embeddings_cache'),
+                'current_episode': str(agent_dir / 'current_episode.json')
             },
             'symbols_of_interest': symbols or ['AAPL', 'GOOGL', 'MSFT'],
             'metrics': {
@@ -330,7 +537,9 @@ class Agent:
         # Save state configuration
         config_path = agent_dir / 'agent_state.yaml'
         with open(config_path, 'w') as f:
-            yaml.dump(state_config, f, default_flow_style=False, sort_keys=False)
+            yaml.dump(state_config, f, Dumper=_yaml_dumper(), default_flow_style=False, sort_keys=False)
+        with open(config_path.with_suffix('.json'), 'w') as f:
+            json.dump(state_config, f, indent=2)
         
         # Create and save initial portfolio
         portfolio = Portfolio()
@@ -347,11 +556,13 @@ class Agent:
         
         tool_call = tool_calls[0]
         method_name = tool_call.function.name
-        args = json.loads(tool_call.function.arguments)
+        if method_name not in action_flow_tool_names:
+            raise ValueError(f"Unknown tool '{method_name}' in completion response.")
+        args = from_json(tool_call.function.arguments)
 
         method = getattr(self.portfolio, method_name)
-        sig = inspect.signature(method)
-        valid_args = {k: v for k, v in args.items() if k in sig.parameters}
+        accepted_params = action_flow_tool_params[method_name]
+        valid_args = {k: v for k, v in args.items() if k in accepted_params}
         transaction = method(**valid_args)
 
         action = Action(action_type=ActionType.from_str(method_name),
@@ -363,8 +574,8 @@ class Agent:
     def run_action(self):
         print("-Action-")
         # get news summary
-        news = self.news_client.get_daily_news_summary("AAPL")
-        news += "\n"+self.world_news_client.get_daily_news_summary("AAPL")
+        news_summaries = self.get_news_summaries()
+        news = deduplicate_lines("\n".join(news_summaries))
         print(f"Retrieved news: {news[:100]}...(truncated)")
         
         # create new episode 
@@ -381,15 +592,17 @@ class Agent:
         print(f"Retrieved similar episodes: {similar_episodes_str[:100]}...(truncated)")
         
         # choose action
-        flow_2_prompt = flow_2_prompt_template.render(setting_prompt=setting_prompt,
-                    current_date=datetime.now(),
+        flow_2_prompt = build_flow_2_prompt(current_date=datetime.now().strftime('%A, %d of %B'),
                     portfolio=str(self.portfolio),
                     transaction_history = str(self.portfolio.transaction_history),
                     symbols_of_interest = str(self.symbols_of_interest),
                     news_summaries = news,
                     memories = similar_episodes_str)
         
-        completion, cost = query_llm_with_tools(flow_2_prompt, tools=action_flow_tools)
+        completion, cost = query_llm_with_tools(flow_2_prompt, tools=action_flow_tools,
+                                                system_prompt=flow_2_system_prompt,
+                                                cache=self.action_llm_cache,
+                                                prompt_cache=self.prompt_cache)
         
         # run action
         action = self.execute_tool_call(completion)
@@ -403,6 +616,34 @@ class Agent:
         self.save_state()
         
         
+    def prefetch_news(self):
+        """Start fetching the news summaries in the background; the next get_news_summaries call consumes them."""
+        if self._news_prefetch is None:
+            self._news_prefetch = [(self._news_executor.submit(self.news_client.get_daily_news_summary, symbol),
+                                    self._news_executor.submit(self.world_news_client.get_daily_news_summary, symbol))
+                                   for symbol in self.symbols_of_interest]
+
+    def get_news_summaries(self) -> List[str]:
+        """Fetch the daily news summary of each symbol of interest, aligned with self.symbols_of_interest."""
+        self.prefetch_news()
+        news_futures, self._news_prefetch = self._news_prefetch, None
+        return [news_future.result()+"\n"+world_news_future.result() for news_future, world_news_future in news_futures]
+
+    def discard_news_prefetch(self):
+        """Drop news prefetched but not consumed (e.g. the tick failed before its action), so no later tick reuses them."""
+        news_futures, self._news_prefetch = self._news_prefetch, None
+        for news_future, world_news_future in news_futures or []:
+            news_future.cancel()
+            world_news_future.cancel()
+
+    def close(self):
+        """Wait for pending saves and release the worker threads used for fetching news and saving."""
+        self.wait_for_save()
+        self._save_executor.shutdown(wait=True)
+        self._news_executor.shutdown(wait=True)
+        if self.prompt_cache is not None:
+            self.prompt_cache.close()
+
     def run_reflection(self):
         pass
         print("-Reflection-")
@@ -417,16 +658,21 @@ class Agent:
         print(f"Loaded current episode")
 
         # evaluate experience
-        flow_1_prompt = flow_1_prompt_template.render(setting_prompt=setting_prompt,
-                            latest_memory=str(episode),
+        flow_1_prompt = build_flow_1_prompt(latest_memory=str(episode),
                             portfolio=str(self.portfolio),
                             transaction_history = str(self.portfolio.transaction_history))
         
-        completion, cost = query_llm_with_structured_output(flow_1_prompt, response_format=ReflectionOutput)
+        completion, cost = query_llm_with_structured_output(flow_1_prompt, response_format=ReflectionOutput,
+                                                            system_prompt=flow_1_system_prompt,
+                                                            cache=self.reflection_llm_cache,
+                                                            prompt_cache=self.prompt_cache)
         print(f"Generated reflection")
 
         # instanciate reflection object
         posterior_position = self.portfolio.positions.get(episode.experience.action.transaction.symbol) if episode.experience.action.transaction else None
+        if posterior_position is not None:
+            # Snapshot, as the live position keeps changing with later updates and trades (and the reflection is frozen)
+            posterior_position = posterior_position.model_copy()
         reflection = Reflection(posterior_position=posterior_position,
                         expectation_evaluation=completion.expectation_evaluation,
                         learning=completion.learning)
@@ -439,11 +685,53 @@ class Agent:
 
         
     def run(self):
-        self.run_reflection()
-        self.run_action()
+        # Make sure the previous tick's state is on disk before starting a new one
+        self.wait_for_save()
+        # The action's news do not depend on the reflection, so fetch them while the reflection LLM call runs
+        if self.state_data['agent_config'].get('prefetch', True):
+            self.prefetch_news()
+        try:
+            self.run_reflection()
+            self.run_action()
+        finally:
+            self.discard_news_prefetch()
 
 
+class AgentFleet:
+    """A group of agents whose portfolios are revalued together, requesting each symbol's price once for the whole fleet."""
+    def __init__(self, agents: List[Agent]):
+        self.agents = agents
+
+    @classmethod
+    def from_directory(cls, base_path: str) -> 'AgentFleet':
+        """Load every agent below base_path (one sub-directory with an agent_state.yaml per agent)."""
+        return cls([Agent(str(config_path)) for config_path in sorted(Path(base_path).glob('*/agent_state.yaml'))])
+
+    def update_all_portfolio_metrics(self) -> List[Optional[float]]:
+        """
+        Update every agent's portfolio (positions and since-last-update metrics, as Portfolio.update) at current market
+        prices fetched once for the fleet, and record the new values in the agents' metrics.
+        Returns the portfolio value of each agent, None for agents without a portfolio.
+        """
+        portfolios = [agent.portfolio for agent in self.agents]
+        prices = market.get_prices(sorted({symbol for portfolio in portfolios if portfolio for symbol in portfolio.positions}))
+        portfolio_values = []
+        for agent, portfolio in zip(self.agents, portfolios):
+            if portfolio is None:
+                portfolio_values.append(None)
+                continue
+            portfolio.update(prices=prices)
+            agent.update_metric('portfolio_value', portfolio.portfolio_value)
+            portfolio_values.append(portfolio.portfolio_value)
+        return portfolio_values
+
+    def save_state(self):
+        for agent in self.agents:
+            agent.save_state()
 
+    def close(self):
+        for agent in self.agents:
+            agent.close()
 
 
 # Usage example:
@@ -470,6 +758,8 @@ if __name__ == "__main__":
     
     # Save state
     agent_state.save_state()
+    agent_state.export()
+    agent_state.close()
         
         
         
@@ -1,9 +1,44 @@
 import os
+import re
+import sys
+import json
+import shelve
+import hashlib
+import functools
+import importlib.util
 from dotenv import load_dotenv
 load_dotenv()
 import openai
+import numpy as np
+from collections import OrderedDict
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+def lazy_import(name):
+    """Return module `name`, deferring its actual import until the first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+# faiss loads a large SWIG extension, which only code paths that actually use an index should pay for;
+# it is only needed by SemanticCache, so llm_utils stays importable without it
+try:
+    faiss = lazy_import("faiss")
+except ModuleNotFoundError:
+    faiss = None
+
+@functools.cache
+def get_openai_client():
+    """One shared client for all requests, so its pooled connections are kept alive across calls and threads."""
+    return openai.OpenAI(api_key=openai.api_key)
+
 model_prices = {
     "gpt-4o-mini": (0.15, 0.6),
     "gpt-4o": (2.5, 10),
@@ -11,33 +46,142 @@ model_prices = {
     "o1-mini": (3, 12)
 }
 
-def query_llm_with_structured_output(prompt, response_format, model="gpt-4o-mini"):
-    chat_completion = openai.beta.chat.completions.parse(
+def build_messages(prompt, system_prompt=None):
+    """Send the static system prompt first so the provider can cache it as a shared prefix; the per-call prompt follows as user message."""
+    if system_prompt is None:
+        return [{"role": "system", "content": prompt}]
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+
+class SemanticCache:
+    """
+    In-memory cache of LLM responses keyed by prompt embedding.
+    A lookup hits when the cosine similarity between the new prompt and a cached one reaches the threshold.
+    Entries are kept apart per call signature (model, system prompt, tools/response format), so responses of
+    different shapes never get mixed up; each signature holds at most max_size entries, evicting the least recently used.
+    """
+    def __init__(self, threshold=0.95, dimension=1536, max_size=1024):
+        if faiss is None:
+            raise ModuleNotFoundError("SemanticCache requires faiss (pip install faiss-cpu)", name="faiss")
+        self.threshold = threshold
+        self.dimension = dimension
+        self.max_size = max_size
+        self._indices = {}  # signature -> IndexIDMap(IndexFlatIP); inner product on normalized vectors = cosine similarity
+        self._responses = {}  # signature -> OrderedDict(id -> response), least recently used first
+        self._next_id = 0
+
+    def embed(self, prompt):
+        embedding = np.array([get_text_embedding(prompt)], dtype='float32')
+        faiss.normalize_L2(embedding)
+        return embedding
+
+    def lookup(self, embedding, signature=None):
+        """Return the cached response of the most similar prompt, or None if it is not similar enough."""
+        index = self._indices.get(signature)
+        if index is None or not index.ntotal:
+            return None
+        similarities, ids = index.search(embedding, 1)
+        if similarities[0, 0] >= self.threshold:
+            responses = self._responses[signature]
+            responses.move_to_end(int(ids[0, 0]))
+            return responses[int(ids[0, 0])]
+        return None
+
+    def add(self, embedding, response, signature=None):
+        if signature not in self._indices:
+            self._indices[signature] = faiss.IndexIDMap(faiss.IndexFlatIP(self.dimension))
+            self._responses[signature] = OrderedDict()
+        index, responses = self._indices[signature], self._responses[signature]
+        index.add_with_ids(embedding, np.array([self._next_id], dtype='int64'))
+        responses[self._next_id] = response
+        self._next_id += 1
+        if len(responses) > self.max_size:
+            evicted_id, _ = responses.popitem(last=False)
+            index.remove_ids(np.array([evicted_id], dtype='int64'))
+
+class PromptCache:
+    """
+    Persistent cache of the responses of the agent's reflection and action calls (query_llm_with_structured_output
+    and query_llm_with_tools with prompt_cache=), keyed by a hash of the call signature and the prompt.
+    The prompts embed the time of the portfolio summary, transactions and episodes, which changes on every call, so it
+    is left out of the key: a prompt repeated on the same day with the same portfolio, news and memories (e.g. a re-run
+    or backtest of a day) is answered from disk, without an API or embedding request.
+    """
+    # "YYYY-MM-DD HH:MM:SS" timestamps as rendered into the prompts; only their date is kept in the key
+    _TIMESTAMP = re.compile(r"(\d{4}-\d{2}-\d{2})[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?")
+
+    def __init__(self, path):
+        self._shelf = shelve.open(str(path))
+
+    @classmethod
+    def key(cls, prompt, signature=None):
+        prompt = cls._TIMESTAMP.sub(r"\1", prompt)
+        return hashlib.blake2b(json.dumps([signature, prompt]).encode(), digest_size=16).hexdigest()
+
+    def lookup(self, prompt, signature=None):
+        return self._shelf.get(self.key(prompt, signature))
+
+    def add(self, prompt, response, signature=None):
+        self._shelf[self.key(prompt, signature)] = response
+
+    def close(self):
+        self._shelf.close()
+
+def query_llm_with_structured_output(prompt, response_format, model="gpt-4o-mini", system_prompt=None, cache=None, prompt_cache=None):
+    if cache is not None or prompt_cache is not None:
+        signature = (model, system_prompt, response_format.__qualname__)
+    if prompt_cache is not None:
+        cached = prompt_cache.lookup(prompt, signature)
+        if cached is not None:
+            return cached, 0.0
+    if cache is not None:
+        embedding = cache.embed(prompt)
+        cached = cache.lookup(embedding, signature)
+        if cached is not None:
+            return cached, 0.0
+    chat_completion = get_openai_client().beta.chat.completions.parse(
         model=model,
-        messages=[
-            {"role": "system", "content": prompt}
-        ],
+        messages=build_messages(prompt, system_prompt),
         response_format=response_format
     )
     cost = (chat_completion.usage.prompt_tokens * model_prices[model][0]) + (chat_completion.usage.completion_tokens * model_prices[model][1])
     cost /= 1000000
+    if cache is not None:
+        cache.add(embedding, chat_completion.choices[0].message.parsed, signature)
+    if prompt_cache is not None:
+        prompt_cache.add(prompt, chat_completion.choices[0].message.parsed, signature)
     return chat_completion.choices[0].message.parsed, cost
     
-def query_llm_with_tools(prompt, tools, model="gpt-4o-mini"):
-    chat_completion = openai.chat.completions.create(
+def query_llm_with_tools(prompt, tools, model="gpt-4o-mini", system_prompt=None, cache=None, prompt_cache=None):
+    if cache is not None or prompt_cache is not None:
+        signature = (model, system_prompt, json.dumps(tools, sort_keys=True))
+    if prompt_cache is not None:
+        cached = prompt_cache.lookup(prompt, signature)
+        if cached is not None:
+            return cached, 0.0
+    if cache is not None:
+        embedding = cache.embed(prompt)
+        cached = cache.lookup(embedding, signature)
+        if cached is not None:
+            return cached, 0.0
+    chat_completion = get_openai_client().chat.completions.create(
         model=model,
-        messages=[
-            {"role": "system", "content": prompt}
-        ],
+        messages=build_messages(prompt, system_prompt),
         tools=tools,
         tool_choice="required"
     )
     cost = (chat_completion.usage.prompt_tokens * model_prices[model][0]) + (chat_completion.usage.completion_tokens * model_prices[model][1])
     cost /= 1000000
+    if cache is not None:
+        cache.add(embedding, chat_completion, signature)
+    if prompt_cache is not None:
+        prompt_cache.add(prompt, chat_completion, signature)
     return chat_completion, cost
 
 def query_llm(prompt, model="gpt-4o-mini"):
-    chat_completion = openai.chat.completions.create(
+    chat_completion = get_openai_client().chat.completions.create(
         model=model,
         messages=[
             {"role": "system", "content": "You are an autonomous stock-trading agent."},
@@ -49,12 +193,31 @@ def query_llm(prompt, model="gpt-4o-mini"):
     return chat_completion.choices[0].message.content, cost
         
         
-def get_text_embedding(input):
-    response = openai.embeddings.create(
-          model="text-embedding-3-small",
+def get_text_embedding(input, model="text-embedding-3-small"):
+    """Embed a text; a list of texts is embedded with one batched request (see get_text_embeddings)."""
+    if not isinstance(input, str):
+        return get_text_embeddings(list(input), model=model)
+    return _get_text_embedding_cached(input, model).tolist()
+
+@functools.lru_cache(maxsize=128)
+def _get_text_embedding_cached(input, model):
+    # Memoized per process, so a text repeated within a run (e.g. an unchanged prompt) is embedded only once.
+    # Kept small and stored as float32 (6 KB per 1536-dim embedding); EmbeddingCache persists the episode embeddings.
+    response = get_openai_client().embeddings.create(
+          model=model,
           input=input
       )
-    return response.data[0].embedding  
+    embedding = np.array(response.data[0].embedding, dtype='float32')
+    embedding.flags.writeable = False  # shared by all callers of the memo
+    return embedding
+
+def get_text_embeddings(inputs, model="text-embedding-3-small"):
+    """Embed a list of texts with a single API request; embeddings are returned in input order."""
+    response = get_openai_client().embeddings.create(
+          model=model,
+          input=inputs
+      )
+    return [data.embedding for data in sorted(response.data, key=lambda data: data.index)]
    
 # Example usage
 #prompt = "This is an initial testprompt. Please answer with 'OK'" #create_prompt(agent_state, environment_data)
@@ -1,14 +1,31 @@
-import yfinance as yf
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Prices fetched within the last PRICE_CACHE_TTL seconds are reused, so repeated lookups of a symbol during one tick
+# (buy/sell, portfolio update, metrics) cost a single yfinance request
+PRICE_CACHE_TTL = 60
+PRICE_CACHE_MAXSIZE = 256
+_price_cache = {}  # symbol -> (monotonic fetch time, price)
+# get_prices fills the cache from worker threads; the lock is held for cache access only, never during a request
+_price_cache_lock = threading.Lock()
+
 
 class Sensors:
     def __init__(self, tickers):
         self.tickers = tickers  # List of stock symbols to monitor
 
     def get_stock_data(self):
+        import yfinance as yf  # imported on first use, yfinance (and pandas) take ~0.4s to import
         data = {}
+        if not self.tickers:
+            return data
+        # One threaded multi-ticker download instead of a history request per ticker
+        history = yf.download(list(self.tickers), period="1d", group_by="ticker", threads=True, progress=False)
         for ticker in self.tickers:
-            stock = yf.Ticker(ticker)
-            info = stock.history(period="1d")  # Get today's data
+            if ticker not in history.columns.get_level_values(0):
+                continue
+            info = history[ticker].dropna(how="all")
             if not info.empty:
                 latest = info.iloc[-1]
                 data[ticker] = {
@@ -17,8 +34,18 @@ class Sensors:
                 }
         return data
 
+def clear_price_cache():
+    with _price_cache_lock:
+        _price_cache.clear()
+
 def get_price_for_symbol(symbol: str):
+    now = time.monotonic()
+    with _price_cache_lock:
+        cached = _price_cache.get(symbol)
+    if cached is not None and now - cached[0] < PRICE_CACHE_TTL:
+        return cached[1]
     print(f"API CALL: yfinance - requesting price for {symbol}")
+    import yfinance as yf
     stock = yf.Ticker(symbol)
     try:
         price = stock.info['currentPrice']
@@ -27,8 +54,26 @@ def get_price_for_symbol(symbol: str):
     if price <= 0:
         raise ValueError(f"Negative market price {price} for symbol {symbol}.")
     print(f"Price is {price}")
+    with _price_cache_lock:
+        if len(_price_cache) >= PRICE_CACHE_MAXSIZE:
+            for stale_symbol in [s for s, (fetched, _) in _price_cache.items() if now - fetched >= PRICE_CACHE_TTL]:
+                del _price_cache[stale_symbol]
+            if len(_price_cache) >= PRICE_CACHE_MAXSIZE:
+                del _price_cache[next(iter(_price_cache))]  # drop the oldest entry
+        _price_cache[symbol] = (now, price)
     return price
 
+def get_prices(symbols):
+    """
+    Prices of several symbols, as a dict from symbol to price (None where no price is available).
+    The requests are issued concurrently, so fetching N uncached symbols costs about one round trip instead of N.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if len(symbols) <= 1:
+        return {symbol: get_price_for_symbol(symbol) for symbol in symbols}
+    with ThreadPoolExecutor(max_workers=min(16, len(symbols)), thread_name_prefix="prices") as executor:
+        return dict(zip(symbols, executor.map(get_price_for_symbol, symbols)))
+
 """
 # Example usage
 sensors = Sensors(["AAPL", "GOOGL", "MSFT"])
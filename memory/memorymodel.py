@@ -1,12 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from portfolio import Portfolio, Position, Transaction
 from enum import Enum
 from typing import Optional
-import json
 from datetime import datetime
-from typing import Optional
 
 from uuid import uuid4
+from functools import cached_property
 
 class ActionType(str, Enum):
     BUY = "BUY"
@@ -38,7 +37,7 @@ class Experience(BaseModel):
 
     def __str__(self):
         parts = [
-            f"Date:\n {self.date.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"Date:\n {self.date.isoformat(sep=' ', timespec='seconds')}",
             f"News of the Day:\n {self.perception.news_of_the_day}",
             f"Action:\n {self.action.action_type if self.action else "None"}",
             f"Transaction:\n {str(self.action.transaction) if (self.action and self.action.transaction) else 'None'}",
@@ -52,11 +51,24 @@ class ReflectionOutput(BaseModel):
     learning: str
     
 class Reflection(BaseModel):
+    # Reflections are never changed once written, so the rendered text is computed only once
+    model_config = ConfigDict(frozen=True)
+
     posterior_position: Optional[Position] = None
     expectation_evaluation: str
     learning: str
 
     def __str__(self):
+        return self.rendered
+
+    def model_copy(self, *, update=None, deep=False):
+        # The copy starts from this instance's __dict__, which holds the cached rendering of the old field values
+        copied = super().model_copy(update=update, deep=deep)
+        copied.__dict__.pop('rendered', None)
+        return copied
+
+    @cached_property
+    def rendered(self) -> str:
         parts = [
             f"Posterior Position:\n {str(self.posterior_position) if self.posterior_position else 'None'}",
             f"Expectation Evaluation:\n {self.expectation_evaluation}",
@@ -65,7 +77,7 @@ class Reflection(BaseModel):
         return "\n\n".join(parts)
 
 class Episode(BaseModel):
-    unique_id: str = str(uuid4())
+    unique_id: str = Field(default_factory=lambda: uuid4().hex)
     experience: Experience
     reflection: Optional[Reflection] = None
         
@@ -95,7 +107,7 @@ class Episode(BaseModel):
            expectation="AAPL stock will rise after the new AI product announcement.")
         
         if with_reflection:
-            reflection = Reflection(posterior_position=portfolio.positions[list(portfolio.positions)[0]],
+            reflection = Reflection(posterior_position=portfolio.positions[next(iter(portfolio.positions))],
                             expectation_evaluation="AAPL stock stayed on the same level in the course of 24h, disregarding the new product announcement.",
                             learning="New product launches do not affect the market in a short timespan.")
             return cls(experience=experience,
@@ -1,25 +1,68 @@
 
-from tinydb import TinyDB, Query
-import faiss
+from tinydb import TinyDB
 import numpy as np
 from pathlib import Path
 import os
+import re
 import json
-from llm_utils import get_text_embedding
+import shutil
+import sqlite3
+import hashlib
+from collections import OrderedDict
+from llm_utils import get_text_embeddings, lazy_import
+faiss = lazy_import("faiss")
 from memory.memorymodel import Episode
+from pydantic import TypeAdapter
+
+# Validator of a whole batch of episodes, built once
+EPISODE_LIST_ADAPTER = TypeAdapter(list[Episode])
 
 class MemoryController:
-    def __init__(self, agent_name: str):
-        self.local_path = Path("agents") / agent_name
+    def __init__(self, agent_name: str, index_factory: str = "Flat", ann_index_factory: str = None,
+                 ann_threshold: int = 1000, nprobe: int = 8, embedding_dtype: str = "float32",
+                 embedding_model: str = "text-embedding-3-small", exact_search_threshold: int = 2048, ef_search: int = 64,
+                 file_paths: dict = None):
+        """
+        Args:
+            file_paths: The agent's configured memory files ('memory_mapping', 'memory_embeddings', 'embeddings_cache',
+                'current_episode'); files not configured (agents of earlier versions) live next to the memory mapping,
+                by default in agents/<agent_name>.
+        """
+        file_paths = file_paths or {}
+        self.local_path = Path(file_paths.get('memory_mapping', Path("agents") / agent_name / "memory_mapping.sqlite")).parent
+        def path(key, default_name):
+            return Path(file_paths.get(key, self.local_path / default_name))
         os.makedirs(self.local_path, exist_ok = True)
-        self.memory_index = MemoryIndex(db_path= self.local_path / "memory_index.json")
-        self.embeddings_store = EmbeddingsStore(index_path= self.local_path / "faiss_index.bin")
-        self.current_episode_store = TinyDB(self.local_path  / 'current_episode_store.json')  # Separate store for incomplete episodes
+        self.embedding_cache = EmbeddingCache(path('embeddings_cache', "embeddings_cache"), model=embedding_model)
+        self.memory_index = MemoryIndex(db_path= path('memory_mapping', "memory_mapping.sqlite"),
+                                        legacy_path= path('memory_index', "memory_index.json"))
+        self.embeddings_store = EmbeddingsStore(index_path= path('memory_embeddings', "faiss_index.bin"), index_factory=index_factory,
+                                                ann_index_factory=ann_index_factory, ann_threshold=ann_threshold, nprobe=nprobe,
+                                                embedding_dtype=embedding_dtype, exact_search_threshold=exact_search_threshold,
+                                                ef_search=ef_search)
+        # The current (incomplete) episode is a single JSON file, rewritten on every save
+        self.current_episode_path = path('current_episode', 'current_episode.json')
+        self._import_legacy_current_episode(path('current_episode_store', 'current_episode_store.json'))
+
+    def _import_legacy_current_episode(self, legacy_path):
+        """Move the latest episode of the TinyDB current_episode_store of earlier versions into current_episode.json."""
+        if self.current_episode_path.exists() or not legacy_path.exists():
+            return
+        legacy_db = TinyDB(legacy_path)
+        try:
+            documents = legacy_db.all()
+        finally:
+            legacy_db.close()
+        if documents:
+            self.save_current_episode(Episode.model_validate(documents[-1]))
+        os.remove(legacy_path)
 
     def save_current_episode(self, episode):
-        """Save the current (incomplete) episode to the current_episode_store."""
-        episode_dict = json.loads(episode.model_dump_json())
-        self.current_episode_store.insert(episode_dict)
+        """Save the current (incomplete) episode, replacing the previous one atomically."""
+        tmp_path = self.current_episode_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(episode.model_dump_json())
+        os.replace(tmp_path, self.current_episode_path)
 
     def save_finished_episode(self, episode, remove_current=True):
         """Finalize the current episode by moving it to the main memory index and generating an embedding."""
@@ -28,81 +71,443 @@ class MemoryController:
         
         # Generate an embedding for the finalized episode
         episode_str = str(episode)  # Use string representation for embedding
-        embedding = get_text_embedding(episode_str)
+        embedding = self.embedding_cache.get_embeddings([episode_str])[0]
         
         # Save the embedding to the embeddings store
         self.embeddings_store.save_embedding(embedding, episode_id)
         
-        # Remove all episodes from the current_episode_store using truncate
+        # The episode is finished, so there is no current episode anymore
         if remove_current:
-            self.current_episode_store.truncate() #remove(Query().unique_id == episode.unique_id)
+            try:
+                os.remove(self.current_episode_path)
+            except FileNotFoundError:
+                pass
 
     def get_current_episode(self):
         """Retrieve the current (incomplete) episode."""
-        current_episode_dict = self.current_episode_store.all()
-        if current_episode_dict:
-            return Episode.model_validate(current_episode_dict[-1])  # Deserialize the dictionary back into an Episode object
-        return None
+        try:
+            with open(self.current_episode_path, 'rb') as f:
+                return Episode.model_validate_json(f.read())
+        except FileNotFoundError:
+            return None
     
     def get_similar_episodes(self, episode, best_k = 5):
         if not self.get_memory_count():
             return None
-        embedding = get_text_embedding(str(episode))
-        episode_ids, distances = self.embeddings_store.get_similar_embeddings(embedding, best_k)
-        episodes = [Episode.model_validate(self.memory_index.get_episode(episode_id)) for episode_id in episode_ids]
-        return episodes
+        return self.get_similar_episodes_batch([episode], best_k)[0]
+
+    def get_similar_episodes_batch(self, episodes, best_k = 5):
+        """Retrieve similar episodes for several query episodes with a single FAISS search."""
+        if not self.get_memory_count():
+            return [None for _ in episodes]
+        # Query episodes (with the day's news and timestamps) rarely repeat, so their embeddings are not written to disk
+        embeddings = self.embedding_cache.get_embeddings([str(episode) for episode in episodes], persist=False)
+        episode_ids, distances = self.embeddings_store.get_similar_embeddings_batch(embeddings, best_k)
+        # Resolve the neighbours of all queries with a single lookup in the memory index
+        payloads = self.memory_index.get_episode_payloads(episode_id for episode_id in episode_ids.flat if episode_id != -1)
+        # Parse all stored JSON payloads with a single pydantic-core call instead of going through intermediate dicts
+        found = dict(zip(payloads, EPISODE_LIST_ADAPTER.validate_json(f"[{','.join(payloads.values())}]")))
+        return [[found[int(episode_id)] for episode_id in row if episode_id != -1]
+                for row in episode_ids]
     
     def get_memory_count(self):
-        return len(self.memory_index.db)
+        return len(self.memory_index)
+
+    def remove_episodes(self, episode_ids):
+        """Prune finished episodes from memory: their embeddings from the FAISS index and their records from the memory index."""
+        episode_ids = [int(episode_id) for episode_id in episode_ids]
+        self.embeddings_store.remove_embeddings(episode_ids)
+        self.memory_index.remove_episodes(episode_ids)
+
+
+class EmbeddingCache:
+    """Memoizes text embeddings by content hash, so identical episode strings are only sent to the embedding model once.
+    Recently used embeddings are kept in memory (at most max_size); embeddings added with persist=True (the finished
+    episodes stored in the index) are also written as one .npy file per text under cache_dir."""
+    def __init__(self, cache_dir, model="text-embedding-3-small", max_size=256):
+        self.cache_dir = Path(cache_dir)
+        self.model = model
+        self.max_size = max_size
+        self._embedding_cache = OrderedDict()  # key -> embedding, least recently used first
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Embeddings of different models are not comparable, so drop the cache when the model changes
+        model_file = self.cache_dir / "model.txt"
+        if model_file.exists() and model_file.read_text() != model:
+            print(f"EmbeddingCache: embedding model changed to {model}, clearing {self.cache_dir}")
+            shutil.rmtree(self.cache_dir)
+            os.makedirs(self.cache_dir)
+        model_file.write_text(model)
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+    def _remember(self, key, embedding):
+        self._embedding_cache[key] = embedding
+        self._embedding_cache.move_to_end(key)
+        if len(self._embedding_cache) > self.max_size:
+            self._embedding_cache.popitem(last=False)
+
+    def get(self, text):
+        """Return the cached embedding of text, or None."""
+        key = self.key(text)
+        embedding = self._embedding_cache.get(key)
+        if embedding is None:
+            path = self.cache_dir / f"{key}.npy"
+            if not path.exists():
+                return None
+            embedding = np.load(path)
+        self._remember(key, embedding)
+        return embedding
+
+    def add(self, text, embedding, persist=True):
+        key = self.key(text)
+        embedding = np.asarray(embedding, dtype='float32')
+        self._remember(key, embedding)
+        if persist:
+            np.save(self.cache_dir / f"{key}.npy", embedding)
+        return embedding
+
+    def get_embeddings(self, texts, persist=True):
+        """
+        Embed texts, requesting only the ones not cached yet (in a single batch).
+        persist=False keeps new embeddings in memory only, for one-off texts such as retrieval queries.
+        """
+        embeddings = [self.get(text) for text in texts]
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            new = {text: self.add(text, embedding, persist)
+                   for text, embedding in zip(missing, get_text_embeddings(missing, model=self.model))}
+            embeddings = [new[text] if embedding is None else embedding for text, embedding in zip(texts, embeddings)]
+        return embeddings
 
 
 class MemoryIndex:
-    def __init__(self, db_path='memory_index.json'):
-        self.db = TinyDB(db_path)
-        self.EpisodeQuery = Query()
+    """Maps FAISS ids to finished episodes in a SQLite table, so episodes are read from disk on demand
+    instead of loading the whole history into memory."""
+    def __init__(self, db_path='memory_mapping.sqlite', legacy_path=None):
+        self.db = sqlite3.connect(str(db_path))
+        self.db.create_function("REGEXP", 2, lambda pattern, value: re.search(pattern, value) is not None)
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS episodes (id INTEGER PRIMARY KEY, unique_id TEXT, payload TEXT NOT NULL)")
+            if "unique_id" not in [column[1] for column in self.db.execute("PRAGMA table_info(episodes)")]:
+                # Tables created before the unique_id column existed
+                self.db.execute("ALTER TABLE episodes ADD COLUMN unique_id TEXT")
+                self.db.execute("UPDATE episodes SET unique_id = json_extract(payload, '$.unique_id')")
+            # Not UNIQUE: episodes written before unique_id was generated per instance all share one id
+            self.db.execute("CREATE INDEX IF NOT EXISTS episodes_unique_id ON episodes (unique_id)")
+        if legacy_path is not None and Path(legacy_path).exists() and not len(self):
+            self.import_tinydb(legacy_path)
+
+    def import_tinydb(self, legacy_path):
+        """One-time import of a memory index written by TinyDB, keeping its doc ids (which are the FAISS ids)."""
+        legacy_db = TinyDB(legacy_path)
+        print(f"MemoryIndex: importing {len(legacy_db)} episodes from {legacy_path}")
+        with self.db:
+            self.db.executemany("INSERT INTO episodes (id, unique_id, payload) VALUES (?, ?, ?)",
+                                ((document.doc_id, document.get("unique_id"), json.dumps(document)) for document in legacy_db.all()))
+        legacy_db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM episodes").fetchone()[0]
 
     def save_episode(self, episode):
-        """Save the episode dictionary to the database."""
-        episode_dict = json.loads(episode.model_dump_json())
-        return self.db.insert(episode_dict)
+        """Save the episode to the database and return its id."""
+        with self.db:
+            cursor = self.db.execute("INSERT INTO episodes (unique_id, payload) VALUES (?, ?)",
+                                     (episode.unique_id, episode.model_dump_json()))
+        return cursor.lastrowid
 
     def get_episode(self, episode_id):
         """Retrieve an episode by its ID and return it as a dictionary."""
-        return self.db.get(doc_id=episode_id)
+        row = self.db.execute("SELECT payload FROM episodes WHERE id = ?", (episode_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_episodes(self, episode_ids):
+        """Retrieve several episodes with one query; returns a dict from id to episode dictionary (missing ids are left out)."""
+        return {episode_id: json.loads(payload) for episode_id, payload in self.get_episode_payloads(episode_ids).items()}
+
+    def get_episode_payloads(self, episode_ids):
+        """Like get_episodes, but returns the stored JSON strings, e.g. to validate them straight into Episode models."""
+        episode_ids = list(dict.fromkeys(int(episode_id) for episode_id in episode_ids))
+        if not episode_ids:
+            return {}
+        rows = self.db.execute(f"SELECT id, payload FROM episodes WHERE id IN ({','.join('?' * len(episode_ids))})", episode_ids)
+        return dict(rows.fetchall())
+
+    def get_episode_by_unique_id(self, unique_id):
+        """Retrieve the latest episode with the given Episode.unique_id as a dictionary."""
+        row = self.db.execute("SELECT payload FROM episodes WHERE unique_id = ? ORDER BY id DESC LIMIT 1", (unique_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def remove_episodes(self, episode_ids):
+        """Delete episodes by their IDs."""
+        with self.db:
+            self.db.executemany("DELETE FROM episodes WHERE id = ?", ((int(episode_id),) for episode_id in episode_ids))
 
     def search_episodes(self, query):
-        """Search for episodes based on a query."""
-        return self.db.search(self.EpisodeQuery.episode.search(query))
+        """Search for episodes whose serialized form matches the regular expression `query`."""
+        rows = self.db.execute("SELECT payload FROM episodes WHERE payload REGEXP ? ORDER BY id", (query,))
+        return [json.loads(payload) for payload, in rows]
 
     def get_all_episodes(self):
         """Retrieve all episodes from the database."""
-        return self.db.all()
+        return [json.loads(payload) for payload, in self.db.execute("SELECT payload FROM episodes ORDER BY id")]
     
     def truncate(self):
-        return self.db.truncate()
+        with self.db:
+            self.db.execute("DELETE FROM episodes")
     
 
+# Index types a loaded full-precision flat index is converted to for a reduced embedding_dtype
+QUANTIZED_INDEX_FACTORIES = {"float16": "SQfp16", "int8": "SQ8"}
+
 class EmbeddingsStore:
-    def __init__(self, index_path='faiss_index.bin', dimension=1536):
+    def __init__(self, index_path='faiss_index.bin', dimension=1536, index_factory="Flat",
+                 ann_index_factory=None, ann_threshold=1000, nprobe=8, embedding_dtype="float32", exact_search_threshold=2048,
+                 delta_compaction_ratio=0.1, ef_construction=200, ef_search=64):
+        """
+        Args:
+            index_path: Path of the persisted faiss index
+            dimension: Dimension of the stored embeddings
+            index_factory: faiss factory string of the index created when none exists yet
+                (e.g. "Flat" for exact search, "HNSW32" or "SQfp16" for faster/smaller search).
+                An existing index on disk is always loaded as-is, whatever its type.
+            ann_index_factory: Optional faiss factory string of an approximate index (e.g. "IVF{nlist},Flat") the store
+                migrates to once it holds ann_threshold embeddings. "{nlist}" is filled in based on the number of stored vectors,
+                "{m}" with dimension // 16 product-quantizer subvectors: "IVF{nlist},PQ{m}" stores 1536-dim embeddings in
+                96 bytes instead of 6 KB (PQ training needs an ann_threshold of at least 256).
+            ann_threshold: Number of stored embeddings from which on the approximate index is used
+            nprobe: Number of inverted lists visited per query by IVF indices (higher = better recall, slower search)
+            ef_construction, ef_search: Candidate list sizes of HNSW indices (e.g. "HNSW32") when building the graph and
+                when searching it (higher = better recall, slower)
+            embedding_dtype: "float16" converts a loaded full-precision flat index to half precision ("SQfp16"),
+                halving its memory and disk footprint; "int8" converts it to 8-bit scalar quantization ("SQ8", trained on
+                the stored vectors), a quarter of the footprint. Queries stay float32; faiss decodes the stored vectors.
+            exact_search_threshold: Below this many stored embeddings, searches run as a plain numpy matrix product over
+                an in-memory copy of the vectors, which beats the faiss call overhead for small (young) memories.
+            delta_compaction_ratio: New embeddings are appended to a delta log file next to index_path instead of
+                rewriting the whole index on every save; once the delta holds this fraction of the main index, both are
+                compacted into a single index file again.
+
+        All vectors are L2-normalized, so new indices use inner product as metric, which ranks by cosine similarity.
+        Legacy indices keep their L2 metric (smaller distance = more similar), and so do the delta and the exact search.
+        """
         self.dimension = dimension
         self.index_path = index_path
-        try:
-            self.index = faiss.read_index(str(index_path))
+        self.ann_index_factory = ann_index_factory
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.exact_search_threshold = exact_search_threshold
+        self._vectors = None  # (ids, vectors) copy used for the numpy search of small stores
+        # Reused 1 x d buffers for single queries and saves, which are normalized in place and only read by faiss/numpy
+        self._query_buffer = np.empty((1, dimension), dtype='float32')
+        self._add_buffer = np.empty((1, dimension), dtype='float32')
+        self.delta_path = Path(index_path).with_suffix(".delta.bin")
+        self.delta_compaction_ratio = delta_compaction_ratio
+        # self.index is the persisted index, memory-mapped and never modified in place;
+        # embeddings added since the last compaction live in the small in-memory self._delta
+        # Only a missing file starts a new index; an unreadable one raises instead of silently discarding all memories
+        if Path(index_path).exists():
+            self.index = self._map_index()
             print(f"EmbeddingsStore: loading existing faiss index from {index_path}")
-        except:
-            print(f"EmbeddingsStore: creating new faiss index")
-            self.index = faiss.IndexFlatL2(dimension)
-            self.index = faiss.IndexIDMap(self.index)            
+            self._index_is_mapped = True
+        else:
+            print(f"EmbeddingsStore: creating new faiss index ({index_factory})")
+            self.index = faiss.IndexIDMap(self._build_index(index_factory, faiss.METRIC_INNER_PRODUCT))
+            self._index_is_mapped = False
+        self._delta = self._read_delta()
+        if self._index_is_mapped and embedding_dtype in QUANTIZED_INDEX_FACTORIES and isinstance(faiss.downcast_index(self.index.index), faiss.IndexFlat):
+            self.migrate(QUANTIZED_INDEX_FACTORIES[embedding_dtype])
+        self._set_search_parameters()
+
+    def _map_index(self):
+        """Memory-map the index file instead of copying it into RAM; pages are loaded on demand (read-only for IVF lists)."""
+        return faiss.read_index(str(self.index_path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+    @property
+    def ntotal(self):
+        """Number of stored embeddings, in the index and the delta."""
+        return self.index.ntotal + self._delta.ntotal
+
+    @property
+    def _is_l2(self):
+        return self.index.metric_type == faiss.METRIC_L2
+
+    def _new_delta(self):
+        # Same metric as the main index, so the distances of both can be merged
+        return faiss.IndexIDMap(faiss.IndexFlat(self.dimension, self.index.metric_type))
+
+    def _delta_record_dtype(self):
+        return np.dtype([('id', '<i8'), ('vector', '<f4', (self.dimension,))])
+
+    def _read_delta(self):
+        """Load the delta log of (id, vector) records appended since the last compaction."""
+        delta = self._new_delta()
+        try:
+            with open(self.delta_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return delta
+        record_dtype = self._delta_record_dtype()
+        # Ignore a partially written last record (a crash in the middle of an append)
+        records = np.frombuffer(data[:len(data) - len(data) % record_dtype.itemsize], dtype=record_dtype)
+        # Skip vectors the main index already holds (a crash between compaction and removing the delta file)
+        records = records[~np.isin(records['id'], faiss.vector_to_array(self.index.id_map))]
+        print(f"EmbeddingsStore: loading {len(records)} embeddings from {self.delta_path}")
+        delta.add_with_ids(np.ascontiguousarray(records['vector']), np.ascontiguousarray(records['id']))
+        return delta
+
+    def _append_to_delta_log(self, embedding_array, episode_ids):
+        """Append the new records to the delta file: O(dimension) bytes per embedding, whatever the store size."""
+        records = np.empty(len(episode_ids), dtype=self._delta_record_dtype())
+        records['id'] = episode_ids
+        records['vector'] = embedding_array
+        with open(self.delta_path, 'ab') as f:
+            f.write(records.tobytes())
+
+    def _build_index(self, index_factory, metric_type):
+        index = faiss.index_factory(self.dimension, index_factory, metric_type)
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efConstruction = self.ef_construction
+        return index
+
+    def _set_search_parameters(self):
+        base_index = faiss.downcast_index(self.index.index)
+        if isinstance(base_index, faiss.IndexIVF):
+            faiss.ParameterSpace().set_index_parameter(self.index, "nprobe", self.nprobe)
+        elif isinstance(base_index, faiss.IndexHNSW):
+            base_index.hnsw.efSearch = self.ef_search
+
+    def is_approximate(self):
+        """Whether the index searches approximately (IVF or HNSW) rather than exhaustively."""
+        base_index = faiss.downcast_index(self.index.index)
+        return isinstance(base_index, (faiss.IndexIVF, faiss.IndexHNSW))
+
+    def _get_all_vectors(self):
+        """Ids and vectors of all stored embeddings (index and delta); needs an index that supports reconstruction."""
+        episode_ids = np.concatenate([faiss.vector_to_array(self.index.id_map), faiss.vector_to_array(self._delta.id_map)])
+        vectors = np.concatenate([self.index.index.reconstruct_n(0, self.index.ntotal),
+                                  self._delta.index.reconstruct_n(0, self._delta.ntotal)])
+        return episode_ids, vectors
+
+    def migrate(self, index_factory):
+        """Rebuild the index as `index_factory`, training it on the currently stored vectors and keeping their ids."""
+        episode_ids, vectors = self._get_all_vectors()
+        # Scale the number of IVF lists with the memory size, keeping enough training points per list
+        nlist = max(1, min(int(4 * np.sqrt(len(vectors))), len(vectors) // 39))
+        index_factory = index_factory.format(nlist=nlist, m=max(1, self.dimension // 16))
+        print(f"EmbeddingsStore: migrating faiss index with {len(vectors)} embeddings to {index_factory}")
+        index = self._build_index(index_factory, self.index.metric_type)
+        if not index.is_trained:
+            index.train(vectors)
+        self.index = faiss.IndexIDMap(index)
+        self.index.add_with_ids(vectors, episode_ids)
+        self._index_is_mapped = False
+        self._delta = self._new_delta()
+        self.write_index()
 
     def save_embedding(self, embedding, episode_id):
         """Save an embedding to the FAISS index."""
-        embedding_array = np.array([embedding])
-        self.index.add_with_ids(embedding_array, episode_id)
-        faiss.write_index(self.index, str(self.index_path))
+        embedding_array = self._add_buffer
+        np.copyto(embedding_array[0], embedding)
+        faiss.normalize_L2(embedding_array)
+        episode_ids = np.asarray(episode_id, dtype='int64').reshape(-1)
+        self._delta.add_with_ids(embedding_array, episode_ids)
+        self._vectors = None
+        if self.ann_index_factory and self.ntotal >= self.ann_threshold and not self.is_approximate():
+            self.migrate(self.ann_index_factory)
+        elif self._delta.ntotal > self.delta_compaction_ratio * self.index.ntotal:
+            self.write_index()
+        else:
+            self._append_to_delta_log(embedding_array, episode_ids)
+
+    def remove_embeddings(self, episode_ids):
+        """
+        Remove the embeddings stored under the given episode ids (unknown ids are ignored) and persist the result.
+        The ids live in the IndexIDMap, so no other embedding is renumbered. HNSW indices do not support removal.
+        Returns the number of removed embeddings.
+        """
+        selector = np.asarray(episode_ids, dtype='int64').reshape(-1)
+        if self._index_is_mapped:
+            # The mapped index is read-only, so the removal works on a full in-memory copy
+            self.index = faiss.read_index(str(self.index_path))
+            self._index_is_mapped = False
+        removed = self.index.remove_ids(selector) + self._delta.remove_ids(selector)
+        self._vectors = None
+        self.write_index()
+        return removed
+
+    @staticmethod
+    def _write_atomically(index, path):
+        """Write via a temporary file, so the (possibly memory-mapped) current file is never truncated in place."""
+        tmp_path = f"{path}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, path)
+
+    def write_index(self):
+        """Compact the delta into the index, persist it as a single file and memory-map the result."""
+        # The mapped index is read-only, so the compaction works on a full in-memory copy
+        index = faiss.read_index(str(self.index_path)) if self._index_is_mapped else self.index
+        if self._delta.ntotal:
+            index.add_with_ids(self._delta.index.reconstruct_n(0, self._delta.ntotal), faiss.vector_to_array(self._delta.id_map))
+        self._write_atomically(index, self.index_path)
+        self._delta = self._new_delta()
+        try:
+            os.remove(self.delta_path)
+        except FileNotFoundError:
+            pass
+        self.index = self._map_index()
+        self._index_is_mapped = True
+        self._set_search_parameters()
 
     def get_similar_embeddings(self, embedding, best_k=5):
         """Retrieve the most similar episodes based on the embedding."""
-        embedding_array = np.array([embedding]).astype('float32')
-        distances, episode_id = self.index.search(embedding_array, best_k)
-        return episode_id[0], distances[0]
+        episode_ids, distances = self.get_similar_embeddings_batch([embedding], best_k)
+        return episode_ids[0], distances[0]
+
+    def get_similar_embeddings_batch(self, embeddings, best_k=5):
+        """Retrieve the most similar episodes for each row of an (n, d) batch of embeddings in one search call."""
+        if len(embeddings) == 1:
+            embedding_array = self._query_buffer
+            np.copyto(embedding_array[0], embeddings[0])
+        else:
+            embedding_array = np.array(embeddings, dtype='float32')
+        faiss.normalize_L2(embedding_array)
+        if self.ntotal < self.exact_search_threshold and not self.is_approximate():
+            return self._search_exact(embedding_array, best_k)
+        distances, episode_ids = self.index.search(embedding_array, best_k)
+        if self._delta.ntotal:
+            # Merge the hits of the index and the delta, best first
+            delta_distances, delta_ids = self._delta.search(embedding_array, best_k)
+            distances = np.concatenate([distances, delta_distances], axis=1)
+            episode_ids = np.concatenate([episode_ids, delta_ids], axis=1)
+            order = np.argsort(distances if self._is_l2 else -distances, axis=1, kind='stable')[:, :best_k]
+            distances = np.take_along_axis(distances, order, axis=1)
+            episode_ids = np.take_along_axis(episode_ids, order, axis=1)
+        return episode_ids, distances
+
+    def _search_exact(self, embedding_array, best_k):
+        """Search with numpy over the stored vectors; same metric and output layout as faiss (missing hits are -1)."""
+        if self._vectors is None:
+            self._vectors = self._get_all_vectors()
+        stored_ids, vectors = self._vectors
+        episode_ids = np.full((len(embedding_array), best_k), -1, dtype='int64')
+        missing = np.finfo('float32').max if self._is_l2 else -np.finfo('float32').max
+        distances = np.full((len(embedding_array), best_k), missing, dtype='float32')
+        k = min(best_k, len(stored_ids))
+        if k:
+            scores = embedding_array @ vectors.T
+            if self._is_l2:
+                # Squared L2 distance to the normalized queries; legacy stored vectors may not be normalized
+                scores = np.einsum('ij,ij->i', vectors, vectors) + 1 - 2 * scores
+            ranks = scores if self._is_l2 else -scores
+            top = np.argpartition(ranks, k - 1, axis=1)[:, :k]
+            order = np.argsort(np.take_along_axis(ranks, top, axis=1), axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            episode_ids[:, :k] = stored_ids[top]
+            distances[:, :k] = np.take_along_axis(scores, top, axis=1)
+        return episode_ids, distances
     
@@ -1,14 +1,47 @@
 import os
 from dotenv import load_dotenv
 load_dotenv()
+import requests
+from requests.adapters import HTTPAdapter
 from newsapi import NewsApiClient
 import worldnewsapi
 from worldnewsapi.rest import ApiException
 
-from datetime import datetime, timedelta
+import functools
+from datetime import date, timedelta
 from llm_utils import query_llm
 
 
+# Up to this many concurrent requests per client keep their connection alive (the agent fetches all symbols at once)
+POOL_MAXSIZE = 20
+
+def pooled_session():
+    """requests session reusing keep-alive connections instead of a new TCP/TLS handshake per request."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def search_window():
+    """Yesterday, today and tomorrow as YYYY-MM-DD strings, the date range the news clients search in."""
+    return _search_window(date.today())
+
+@functools.lru_cache(maxsize=1)
+def _search_window(today):
+    return tuple((today + timedelta(days=offset)).strftime('%Y-%m-%d') for offset in (-1, 0, 1))
+
+
+NEWS_SUMMARY_PROMPT = (
+    "Given this partially incomplete list of articles (or article stubs) on the keyword '{topic}', "
+    "write a summary on the news. Make sure to keep the relevant numbers and facts intact. "
+    "Focus in particular on novel potential investment opportunities and impending risks if (and only if) such are mentioned."
+    "Do stick true to the source material."
+    "Make sure to always point out the relevant stock symbols (e.g. AAPL, GOOGL, etc.)\n\n"
+    "{raw_news}")
+
+
 class NewsClient():
     """Base class. Shall not be instanciated"""
     def get_daily_articles(self, topic):
@@ -16,12 +49,7 @@ class NewsClient():
             
     def get_daily_news_summary(self, topic):
         raw_news = self.get_daily_articles(topic)
-        prompt = (f"Given this partially incomplete list of articles (or article stubs) on the keyword '{topic}', "
-            f"write a summary on the news. Make sure to keep the relevant numbers and facts intact. "
-            f"Focus in particular on novel potential investment opportunities and impending risks if (and only if) such are mentioned."
-            f"Do stick true to the source material."
-            f"Make sure to always point out the relevant stock symbols (e.g. AAPL, GOOGL, etc.)\n\n")
-        prompt += raw_news
+        prompt = NEWS_SUMMARY_PROMPT.format(topic=topic, raw_news=raw_news)
         
         summary, cost = query_llm(prompt)
         print(f"API call to LLM: {cost}$")
@@ -33,21 +61,17 @@ class WorldNewsCustomClient(NewsClient):
         api_key = os.getenv("WORLD_NEWS_API_KEY") if not api_key else api_key
         newsapi_configuration = worldnewsapi.Configuration(api_key={'apiKey': api_key})
         newsapi_configuration.api_key['headerApiKey'] = api_key
+        newsapi_configuration.connection_pool_maxsize = POOL_MAXSIZE
         self.newsapi_instance = worldnewsapi.NewsApi(worldnewsapi.ApiClient(newsapi_configuration))
         
     def _format_articles(self, articles) -> str:
-        raw_news = ""
-        for article in articles:
-            raw_news += f"{article.title}: {article.publish_date}\n"
-            raw_news += f"{article.summary}\n"
-            raw_news += f"{article.text}\n"
-            raw_news += "\n"
-        return raw_news
+        return "".join(f"{article.title}: {article.publish_date}\n"
+                       f"{article.summary}\n"
+                       f"{article.text}\n"
+                       "\n" for article in articles)
 
     def get_daily_articles(self, topic):
-        yesterday = (datetime.today() - timedelta(days=1)).strftime('%Y-%m-%d')
-        today = datetime.today().strftime('%Y-%m-%d')
-        tomorrow = (datetime.today() + timedelta(days=1)).strftime('%Y-%m-%d')
+        yesterday, _, tomorrow = search_window()
         try:
             # Fetch news articles
             response = self.newsapi_instance.search_news(
@@ -69,21 +93,16 @@ class WorldNewsCustomClient(NewsClient):
 class NewsApiCustomClient(NewsClient):
     def __init__(self, api_key=None):
         api_key = os.getenv("NEWS_API_KEY") if not api_key else api_key
-        self.news_api = NewsApiClient(api_key=api_key)
+        self.news_api = NewsApiClient(api_key=api_key, session=pooled_session())
     
     def _format_articles(self, articles) -> str:
-        raw_news = ""
-        for art in articles["articles"]:
-            raw_news += f"{art["source"]["name"]}: {art["publishedAt"]}\n"
-            raw_news += f"{art["title"]}\n"
-            raw_news += f"{art["description"]}\n"
-            raw_news += "\n"
-        return raw_news
+        return "".join(f"{art["source"]["name"]}: {art["publishedAt"]}\n"
+                       f"{art["title"]}\n"
+                       f"{art["description"]}\n"
+                       "\n" for art in articles["articles"])
     
     def get_daily_articles(self, topic):
-        yesterday = (datetime.today() - timedelta(days=1)).strftime('%Y-%m-%d')
-        today = datetime.today().strftime('%Y-%m-%d')
-        tomorrow = (datetime.today() + timedelta(days=1)).strftime('%Y-%m-%d')
+        yesterday, today, tomorrow = search_window()
         all_articles = self.news_api.get_everything(q=topic,
                                                     from_param=yesterday,
                                                     to=tomorrow,
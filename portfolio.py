@@ -1,9 +1,10 @@
-import json
 import market
+import pickle
+import numpy as np
+from pathlib import Path
 from datetime import datetime
-from pydantic import BaseModel, Field, computed_field, model_validator
-from datetime import datetime
-from typing import List, Dict
+from pydantic import BaseModel, Field, PrivateAttr, computed_field
+from typing import ClassVar, List, Dict, Optional, Tuple
 
 class Transaction(BaseModel):
     time: datetime = Field(default_factory=datetime.now)
@@ -21,7 +22,7 @@ class Transaction(BaseModel):
 
     def __str__(self):
         """Return a human-readable string representation of the transaction."""
-        return (f"Time: {self.time.strftime('%Y-%m-%d %H:%M:%S')} | "
+        return (f"Time: {self.time.isoformat(sep=' ', timespec='seconds')} | "
                 f"Action: {self.transaction_type.upper()} {self.symbol} @ "
                 f"{self.price:.2f} EUR x {self.quantity:.4f} shares = {self.total_value:.2f}| "
                 f"Cash after: {self.cash_after_transaction:.2f} | "
@@ -29,19 +30,22 @@ class Transaction(BaseModel):
 
 class TransactionHistory(BaseModel):
     history: List[Transaction] = Field(default_factory=list)
+    # (number of transactions rendered, rendered string); the history is append-only, so only new transactions are formatted
+    _rendered: Tuple[int, str] = PrivateAttr(default=(0, ""))
 
-    def log(self, transaction: Transaction = None, **kwargs):
+    def log(self, transaction: Transaction = None, trust_input: bool = False, **kwargs):
         """
         Logs a transaction into the history.
         Allows providing either a Transaction object or individual transaction parameters.
 
         Parameters:
             transaction (Transaction): Optional Transaction object.
+            trust_input (bool): Build the transaction from kwargs without validating them (for already checked values).
             kwargs: Individual transaction fields (type, symbol, price, quantity, cash_after_transaction, comment).
         """
         if transaction is None:
             # Create a transaction object from provided arguments
-            transaction = Transaction.model_validate(kwargs)
+            transaction = Transaction.model_construct(**kwargs) if trust_input else Transaction.model_validate(kwargs)
         
         self.history.append(transaction)
         return transaction
@@ -53,6 +57,7 @@ class TransactionHistory(BaseModel):
     def clear(self):
         """Clears the transaction history."""
         self.history.clear()
+        self._rendered = (0, "")
     
     def __iter__(self):
         return (txn for txn in self.history)
@@ -64,7 +69,14 @@ class TransactionHistory(BaseModel):
         """Returns a formatted string representation of all transactions."""
         if not self.history:
             return "No transactions recorded."
-        return "\n".join(str(txn) for txn in self.history)
+        rendered_count, rendered = self._rendered
+        if rendered_count > len(self.history):  # the history was cleared or truncated since the last rendering
+            rendered_count, rendered = 0, ""
+        if rendered_count < len(self.history):
+            new_lines = "\n".join(str(txn) for txn in self.history[rendered_count:])
+            rendered = f"{rendered}\n{new_lines}" if rendered_count else new_lines
+            self._rendered = (len(self.history), rendered)
+        return rendered
     
     def __len__(self):
         return len(self.history)
@@ -87,14 +99,14 @@ class Position(BaseModel):
     def position_value(self) -> float:
         return self.last_update_price * self.quantity
 
-    def update_position(self, new_price: float):
-        """Update position values based on the new market price."""
+    def update_position(self, new_price: float, now: Optional[datetime] = None):
+        """Update position values based on the new market price (at time `now`, by default the current time)."""
         self.absolute_change_since_start = (new_price - self.buy_price) * self.quantity
         self.relative_change_since_start = (new_price - self.buy_price) / self.buy_price
         self.absolute_change_since_update = (new_price - self.last_update_price) * self.quantity
         self.relative_change_since_update = (new_price - self.last_update_price) / self.last_update_price
         self.last_update_price = new_price
-        self.last_update_time = datetime.now()
+        self.last_update_time = now if now is not None else datetime.now()
 
     def buy(self, price: float, quantity: float):
         """Add more to the position, updating the buy price."""
@@ -103,12 +115,13 @@ class Position(BaseModel):
         self.buy_price = total_cost / self.quantity
         self.update_position(price)
 
-    def sell(self, price: float, quantity: float):
-        """Sell part of the position."""
+    def sell(self, price: float, quantity: float, dust_value: float = 0.0) -> bool:
+        """Sell part of the position; returns whether the rest is worth less than dust_value (and should be closed)."""
         if quantity > self.quantity:
             raise ValueError(f"Cannot sell {quantity} quantity; only {self.quantity} available.")
         self.quantity -= quantity
         self.update_position(price)
+        return self.position_value < dust_value
 
     def __str__(self):
         """Return a human-readable string representation of the position."""
@@ -120,6 +133,9 @@ class Position(BaseModel):
 
 
 class Portfolio(BaseModel):
+    # A position worth less than this (in EUR) after a sale is sold completely
+    DUST_VALUE: ClassVar[float] = 1.0
+
     initial_cash: float = 0.0
     available_cash: float = 0.0
     positions: Dict[str, Position] = Field(default_factory=dict)
@@ -129,28 +145,83 @@ class Portfolio(BaseModel):
     absolute_change_since_update: float = 0.0
     relative_change_since_update: float = 0.0
     last_update_time: datetime = Field(default_factory=datetime.now)
+    # Structure-of-arrays snapshot (quantities, last update prices) of the positions, rebuilt lazily after changes
+    _position_arrays: Optional[Tuple[np.ndarray, np.ndarray]] = PrivateAttr(default=None)
+    # Rendered positions_to_str and total value of the positions, dropped together with the position arrays
+    # whenever a position changes
+    _positions_str: Optional[str] = PrivateAttr(default=None)
+    _invested_value: Optional[float] = PrivateAttr(default=None)
     
     @computed_field
     @property
     def portfolio_value(self) -> float:
         """Calculate the total portfolio value."""
-        return sum(pos.position_value for pos in self.positions.values()) + self.available_cash
+        if self._invested_value is None:
+            quantities, prices = self.get_position_arrays()
+            self._invested_value = float(np.vdot(quantities, prices))
+        return self._invested_value + self.available_cash
+
+    def get_position_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the quantities and last update prices of all positions as aligned arrays."""
+        if self._position_arrays is None:
+            n = len(self.positions)
+            quantities = np.fromiter((pos.quantity for pos in self.positions.values()), dtype=np.float64, count=n)
+            prices = np.fromiter((pos.last_update_price for pos in self.positions.values()), dtype=np.float64, count=n)
+            self._position_arrays = (quantities, prices)
+        return self._position_arrays
+
+    def as_frame(self):
+        """
+        Columnar view of the positions as a pandas DataFrame indexed by symbol (pandas is imported on first use),
+        for vectorized analytics such as sorting, filtering or aggregating positions.
+        """
+        import pandas as pd
+        positions = list(self.positions.values())
+        quantities, prices = self.get_position_arrays()
+        frame = pd.DataFrame({
+            "quantity": quantities,
+            "buy_price": np.fromiter((pos.buy_price for pos in positions), dtype=np.float64, count=len(positions)),
+            "last_update_price": prices,
+            "absolute_change_since_start": [pos.absolute_change_since_start for pos in positions],
+            "relative_change_since_start": [pos.relative_change_since_start for pos in positions],
+            "absolute_change_since_update": [pos.absolute_change_since_update for pos in positions],
+            "relative_change_since_update": [pos.relative_change_since_update for pos in positions],
+        }, index=pd.Index(list(self.positions), name="symbol"))
+        frame["position_value"] = frame["quantity"] * frame["last_update_price"]
+        return frame
+
+    def _invalidate_position_arrays(self):
+        self._position_arrays = None
+        self._positions_str = None
+        self._invested_value = None
 
     def load_cash(self, cash_amount):
         self.initial_cash += cash_amount
         self.available_cash += cash_amount
         return self.initial_cash, self.available_cash
         
+    @staticmethod
+    def _get_valid_price(symbol: str) -> float:
+        """Current market price of symbol as float; raises ValueError if none (or no positive one) is available."""
+        try:
+            price = float(market.get_price_for_symbol(symbol))
+        except TypeError:  # no price (None)
+            raise ValueError("Invalid price retrieved for the symbol.") from None
+        if not price > 0:
+            raise ValueError("Invalid price retrieved for the symbol.")
+        return price
+
     def buy(self, symbol: str, buy_value: float) -> dict:
         """Invest a specified amount into a position."""
         comment = ""
-        price = market.get_price_for_symbol(symbol)
-        if price is None or price <= 0:
-            raise ValueError("Invalid price retrieved for the symbol.")
+        if not buy_value > 0:
+            raise ValueError("The buy value must be positive.")
+        price = self._get_valid_price(symbol)
         shares_to_buy = buy_value / price
         if buy_value > self.available_cash:
             raise ValueError("Not enough cash to complete the transaction.")
         self.available_cash -= buy_value
+        self._invalidate_position_arrays()
         if symbol in self.positions:
             self.positions[symbol].buy(price, shares_to_buy)
         else:
@@ -162,15 +233,15 @@ class Portfolio(BaseModel):
             )
             comment = "position opened"
             
+        # Value, price and cash were checked above (all positive), so the transaction is built without re-running pydantic validation
         return self.transaction_history.log(
-            transaction=Transaction(
-                transaction_type="BUY",
-                symbol=symbol,
-                price=price,
-                quantity=shares_to_buy,
-                cash_after_transaction=self.available_cash,
-                comment=comment
-            )
+            trust_input=True,
+            transaction_type="BUY",
+            symbol=symbol,
+            price=price,
+            quantity=float(shares_to_buy),
+            cash_after_transaction=float(self.available_cash),
+            comment=comment
         )
         
     def sell(self, symbol: str, sell_value: float) -> dict:
@@ -178,31 +249,31 @@ class Portfolio(BaseModel):
         comment = ""
         if symbol not in self.positions:
             raise ValueError(f"No position found for symbol {symbol}.")
-        price = market.get_price_for_symbol(symbol)
-        if price is None or price <= 0:
-            raise ValueError("Invalid price retrieved for the symbol.")
+        if not sell_value > 0:
+            raise ValueError("The sell value must be positive.")
+        price = self._get_valid_price(symbol)
         position = self.positions[symbol]
         shares_to_sell = sell_value / price
         if round(shares_to_sell, 6) > round(position.quantity, 6):
             raise ValueError("Not enough quantity to complete the transaction.")
-        position.sell(price, shares_to_sell)
+        is_dust = position.sell(price, shares_to_sell, self.DUST_VALUE)
+        self._invalidate_position_arrays()
         self.available_cash += sell_value
-        if position.quantity * price < 1:
+        if is_dust:
             shares_to_sell = position.quantity
             sell_value = shares_to_sell * price
             self.available_cash += sell_value
             comment = "position closed"
             del self.positions[symbol]
         return self.transaction_history.log(
-                    transaction=Transaction(
-                        transaction_type="SELL",
-                        symbol=symbol,
-                        price=price,
-                        quantity=shares_to_sell,
-                        cash_after_transaction=self.available_cash,
-                        comment=comment
-                    )
-                )
+            trust_input=True,
+            transaction_type="SELL",
+            symbol=symbol,
+            price=price,
+            quantity=float(shares_to_sell),
+            cash_after_transaction=float(self.available_cash),
+            comment=comment
+        )
         
     def wait(self):
         """dummy function to allow for streamlined function call execution"""
@@ -212,60 +283,106 @@ class Portfolio(BaseModel):
         """Sells all shares of a position at the current market price."""
         if symbol not in self.positions:
             raise ValueError(f"No position found for symbol {symbol}.")
+        price = self._get_valid_price(symbol)  # before removing the position, so a failed lookup leaves it intact
         position = self.positions.pop(symbol)
-        price = market.get_price_for_symbol(symbol)
+        self._invalidate_position_arrays()
         self.available_cash += price * position.quantity
         return self.transaction_history.log(
-                        transaction=Transaction(
-                            transaction_type="SELL",
-                            symbol=symbol,
-                            price=price,
-                            quantity=position.quantity,
-                            cash_after_transaction=self.available_cash,
-                            comment="position_closed"
-                        )
-                    )
+            trust_input=True,
+            transaction_type="SELL",
+            symbol=symbol,
+            price=price,
+            quantity=float(position.quantity),
+            cash_after_transaction=float(self.available_cash),
+            comment="position_closed"
+        )
         
-    def update(self):
-        """Update all positions and portfolio-level metrics."""
+    def update(self, prices: Optional[Dict[str, float]] = None):
+        """
+        Update all positions and portfolio-level metrics.
+
+        Parameters:
+            prices (dict): Optional symbol -> price mapping fetched beforehand (e.g. once for a whole fleet of agents);
+                symbols missing from it are requested from the market.
+        """
         previous_value = self.portfolio_value 
-        for position in self.positions.values():
-            new_price = market.get_price_for_symbol(position.symbol)
+        positions = list(self.positions.values())
+        missing = [position.symbol for position in positions if prices is None or position.symbol not in prices]
+        prices = {**(prices or {}), **(market.get_prices(missing) if missing else {})}
+        new_prices = np.empty(len(positions), dtype=np.float64)
+        for i, position in enumerate(positions):
+            new_price = prices[position.symbol]
             if new_price and new_price > 0:
-                position.update_position(new_price)
+                new_prices[i] = new_price
             else:
                 raise ValueError("Received faulty price data")
-        self.absolute_change_since_update = self.portfolio_value - previous_value
-        self.relative_change_since_update = (self.portfolio_value - previous_value) / previous_value
-        self.absolute_change_since_start = self.portfolio_value - self.initial_cash
-        self.relative_change_since_start = (self.portfolio_value - self.initial_cash) / self.initial_cash
-        self.last_update_time = datetime.now()
+        quantities, last_update_prices = self.get_position_arrays()
+        buy_prices = np.fromiter((pos.buy_price for pos in positions), dtype=np.float64, count=len(positions))
+        from _portfolio_kernels import compute_position_deltas  # imports (and may compile with) numba on first use
+        deltas = compute_position_deltas(quantities, buy_prices, last_update_prices, new_prices)
+        # One clock read for the whole tick, shared by all positions and the portfolio
+        update_time = datetime.now()
+        for position, new_price, abs_start, rel_start, abs_update, rel_update in zip(positions, new_prices.tolist(), *(d.tolist() for d in deltas)):
+            position.absolute_change_since_start = abs_start
+            position.relative_change_since_start = rel_start
+            position.absolute_change_since_update = abs_update
+            position.relative_change_since_update = rel_update
+            position.last_update_price = new_price
+            position.last_update_time = update_time
+        self._invalidate_position_arrays()
+        current_value = self.portfolio_value
+        self.absolute_change_since_update = current_value - previous_value
+        self.relative_change_since_update = (current_value - previous_value) / previous_value
+        self.absolute_change_since_start = current_value - self.initial_cash
+        self.relative_change_since_start = (current_value - self.initial_cash) / self.initial_cash
+        self.last_update_time = update_time
 
     def positions_to_str(self) -> str:
         """Return a summary of all current positions."""
         if not self.positions:
             return "No active positions."
-        return "\n".join(str(position) for position in self.positions.values())
+        if self._positions_str is None:
+            self._positions_str = "\n".join(map(str, self.positions.values()))
+        return self._positions_str
     
     def __str__(self):
         """Return a human-readable summary of the portfolio."""
+        portfolio_value = self.portfolio_value
         summary = (
-            f"Portfolio Summary ({self.last_update_time.strftime('%Y-%m-%d %H:%M:%S')}):\n"
-            f"Total Value: {self.portfolio_value:.2f}\n"
+            f"Portfolio Summary ({self.last_update_time.isoformat(sep=' ', timespec='seconds')}):\n"
+            f"Total Value: {portfolio_value:.2f}\n"
             f"Cash: {self.available_cash:.2f}\n"
-            f"Invested: {self.portfolio_value - self.available_cash:.2f}\n"
+            f"Invested: {portfolio_value - self.available_cash:.2f}\n"
             f"Absolute Change Since Start: {self.absolute_change_since_start:.2f}\n"
             f"Relative Change Since Start: {self.relative_change_since_start:.2%}\n"
             f"{'-' * 60}\n"
         )            
         return summary + self.positions_to_str()
 
+    def dumps(self, binary: bool = False) -> bytes:
+        """Serialize as JSON, or as pickle if binary (faster to write and load, e.g. for long backtests, but not human-readable)."""
+        if binary:
+            return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+        return self.model_dump_json().encode()
+
+    @classmethod
+    def loads(cls, data: bytes) -> 'Portfolio':
+        """Load a portfolio serialized by dumps, detecting the format from its first byte."""
+        if data[:1] == b'\x80':  # pickle protocol 2+ header; JSON starts with '{'
+            return pickle.loads(data)
+        # Parse and validate in one pass in pydantic-core, without building an intermediate dict in Python
+        return cls.model_validate_json(data)
+
+    @staticmethod
+    def is_binary_file(filename) -> bool:
+        """Portfolio files named *.pkl are written with pickle, all others as JSON."""
+        return Path(filename).suffix == '.pkl'
+
     def to_file(self, filename):
-        with open(filename, 'w') as f:
-            f.write(self.model_dump_json())
+        with open(filename, 'wb') as f:
+            f.write(self.dumps(binary=self.is_binary_file(filename)))
     
     @classmethod
     def from_file(cls, filename) -> 'Portfolio':
-        with open(filename, 'r') as f:
-            pf_dict = json.loads(f.read())
-        return cls.model_validate(pf_dict)
\ No newline at end of file
+        with open(filename, 'rb') as f:
+            return cls.loads(f.read())
\ No newline at end of file
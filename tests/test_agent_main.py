@@ -0,0 +1,161 @@
+from agent_main import deduplicate_lines
+
+
+def test_deduplicate_lines_keeps_first_occurrence_and_paragraphs():
+    news = "Apple beats estimates\nChips rally\n\nApple beats estimates \n\nchips rally\nFed holds rates"
+    assert deduplicate_lines(news) == "Apple beats estimates\nChips rally\n\nFed holds rates"
+
+
+def test_failed_tick_discards_prefetched_news(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from types import SimpleNamespace
+    import pytest
+    from agent_main import Agent
+    agent = Agent.__new__(Agent)  # no state files; only the news prefetch is exercised
+    fetched = []
+    client = SimpleNamespace(get_daily_news_summary=lambda symbol: fetched.append(symbol) or f"news {len(fetched)}")
+    agent.news_client = agent.world_news_client = client
+    agent._symbols_of_interest = ["AAPL"]
+    agent.state_data = {'agent_config': {}}
+    agent._news_prefetch = None
+    agent._news_executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(agent, "wait_for_save", lambda: None, raising=False)
+    def failing_reflection():
+        raise RuntimeError("reflection failed")
+    monkeypatch.setattr(agent, "run_reflection", failing_reflection, raising=False)
+    with pytest.raises(RuntimeError):
+        agent.run()
+    assert agent._news_prefetch is None
+    agent._news_executor.shutdown(wait=True)
+    fetched.clear()
+    agent._news_executor = ThreadPoolExecutor(max_workers=1)
+    assert agent.get_news_summaries() == ["news 1\nnews 2"]
+    agent._news_executor.shutdown(wait=True)
+
+
+def test_fleet_updates_portfolios_with_shared_prices(monkeypatch):
+    from portfolio import Portfolio
+    from agent_main import Agent, AgentFleet
+    prices = {"AAPL": 50.0, "MSFT": 20.0}
+    monkeypatch.setattr("market.get_price_for_symbol", lambda symbol: prices[symbol])
+    agents = []
+    for symbols in (["AAPL"], ["AAPL", "MSFT"], None):
+        agent = Agent.__new__(Agent)  # no state files; only the portfolio and metrics are used
+        agent.state_data = {'metrics': {}}
+        agent.portfolio = None
+        if symbols is not None:
+            agent.portfolio = Portfolio()
+            agent.portfolio.load_cash(500)
+            for symbol in symbols:
+                agent.portfolio.buy(symbol, 100)
+        agents.append(agent)
+    requested = []
+    monkeypatch.setattr("market.get_prices", lambda symbols: requested.append(list(symbols)) or {s: prices[s] * 2 for s in symbols})
+    values = AgentFleet(agents).update_all_portfolio_metrics()
+    assert requested == [["AAPL", "MSFT"]]
+    assert values == [600.0, 700.0, None]
+    assert [agent.state_data['metrics'].get('portfolio_value') for agent in agents] == [600.0, 700.0, None]
+    assert agents[1].portfolio.positions["MSFT"].last_update_price == 40.0
+
+
+def make_agent(tmp_path, monkeypatch):
+    import agent_main
+    from agent_main import Agent
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(agent_main, "shared_news_clients", lambda: (None, None))  # no API clients needed
+    return Agent.create_new(base_path=str(tmp_path / "agents"), agent_name="agent01", initial_portfolio_value=1000.0)
+
+
+def test_state_round_trip(tmp_path, monkeypatch):
+    from agent_main import Agent
+    agent = make_agent(tmp_path, monkeypatch)
+    agent.update_metric('custom', 5)
+    agent.save_state()
+    agent.close()
+    assert not list((tmp_path / "agents" / "agent01").glob("*.tmp"))
+    reloaded = Agent(str(agent.config_path))
+    assert reloaded.get_metric('custom') == 5
+    assert reloaded.get_metric('portfolio_value') == 1000.0
+    assert reloaded.state_data['last_run'] == agent.state_data['last_run']
+    assert reloaded.portfolio.model_dump() == agent.portfolio.model_dump()
+    reloaded.close()
+
+
+def test_edited_yaml_wins_over_state_file(tmp_path, monkeypatch):
+    import os
+    import yaml
+    from agent_main import Agent
+    agent = make_agent(tmp_path, monkeypatch)
+    agent.close()
+    with open(agent.config_path) as f:
+        config = yaml.safe_load(f)
+    config['symbols_of_interest'] = ['NVDA']
+    with open(agent.config_path, 'w') as f:
+        yaml.safe_dump(config, f)
+    state_mtime = os.stat(agent.state_path).st_mtime
+    os.utime(agent.config_path, (state_mtime + 10, state_mtime + 10))
+    reloaded = Agent(str(agent.config_path))
+    assert reloaded.symbols_of_interest == ['NVDA']
+    reloaded.close()
+
+
+def test_metrics_sidecar_overrides_stale_state_metrics(tmp_path, monkeypatch):
+    import json
+    from agent_main import Agent
+    agent = make_agent(tmp_path, monkeypatch)
+    agent.save_state()
+    agent.wait_for_save()
+    agent.update_metric('custom', 7)  # metrics only, so the main state file is not rewritten
+    agent.save_state()
+    agent.close()
+    with open(agent.state_path) as f:
+        assert 'custom' not in json.load(f)['metrics']
+    reloaded = Agent(str(agent.config_path))
+    assert reloaded.get_metric('custom') == 7
+    reloaded.close()
+
+
+def test_unchanged_save_only_refreshes_last_run(tmp_path, monkeypatch):
+    import os
+    import json
+    agent = make_agent(tmp_path, monkeypatch)
+    agent.save_state()
+    agent.wait_for_save()
+    os.utime(agent.state_path, ns=(0, 0))  # any rewrite of the state file would change its mtime
+    state_content = agent.state_path.read_bytes()
+    agent.save_state()
+    agent.close()
+    assert os.stat(agent.state_path).st_mtime_ns == 0
+    assert agent.state_path.read_bytes() == state_content
+    with open(agent.metrics_path) as f:
+        assert json.load(f)['last_run'] == agent.state_data['last_run']
+
+
+def test_reflection_keeps_a_snapshot_of_the_position(monkeypatch):
+    from datetime import datetime
+    from types import SimpleNamespace
+    import agent_main
+    from agent_main import Agent
+    from portfolio import Portfolio
+    from memory.memorymodel import Episode, Experience, Perception, Action, ReflectionOutput
+    prices = {"AAPL": 50.0}
+    monkeypatch.setattr("market.get_price_for_symbol", lambda symbol: prices[symbol])
+    monkeypatch.setattr("market.get_prices", lambda symbols: {symbol: prices[symbol] for symbol in symbols})
+    agent = Agent.__new__(Agent)  # no state files; only the reflection flow is exercised
+    agent.portfolio = Portfolio()
+    agent.portfolio.load_cash(500)
+    transaction = agent.portfolio.buy("AAPL", 100)
+    episode = Episode(experience=Experience(date=datetime(2025, 1, 2),
+                                            perception=Perception(news_of_the_day="news", portfolio=Portfolio()),
+                                            action=Action(action_type="BUY", transaction=transaction, expectation="up")))
+    finished = []
+    agent.memory_controller = SimpleNamespace(get_current_episode=lambda: episode, save_finished_episode=finished.append)
+    agent.reflection_llm_cache = agent.prompt_cache = None
+    monkeypatch.setattr(agent_main, "query_llm_with_structured_output",
+                        lambda prompt, response_format, **kwargs: (ReflectionOutput(expectation_evaluation="ok", learning="l"), 0.0))
+    agent.run_reflection()
+    rendered = str(finished[0].reflection)
+    prices["AAPL"] = 80.0
+    agent.portfolio.update()
+    assert finished[0].reflection.posterior_position.last_update_price == 50.0
+    assert str(finished[0].reflection) == rendered
@@ -0,0 +1,49 @@
+import numpy as np
+from llm_utils import SemanticCache, PromptCache
+
+
+def normalized(vector):
+    array = np.array([vector], dtype='float32')
+    return array / np.linalg.norm(array)
+
+# Test cases for SemanticCache
+def test_semantic_cache_separates_signatures():
+    cache = SemanticCache(threshold=0.9, dimension=4)
+    cache.add(normalized([1, 0, 0, 0]), "tools response", signature="tools")
+    assert cache.lookup(normalized([1, 0.1, 0, 0]), signature="tools") == "tools response"
+    assert cache.lookup(normalized([1, 0.1, 0, 0]), signature="structured") is None
+    assert cache.lookup(normalized([0, 1, 0, 0]), signature="tools") is None
+
+def test_semantic_cache_evicts_least_recently_used():
+    cache = SemanticCache(threshold=0.9, dimension=4, max_size=2)
+    cache.add(normalized([1, 0, 0, 0]), "a")
+    cache.add(normalized([0, 1, 0, 0]), "b")
+    assert cache.lookup(normalized([1, 0, 0, 0])) == "a"
+    cache.add(normalized([0, 0, 1, 0]), "c")
+    assert cache.lookup(normalized([0, 1, 0, 0])) is None
+    assert cache.lookup(normalized([1, 0, 0, 0])) == "a"
+    assert cache.lookup(normalized([0, 0, 1, 0])) == "c"
+
+# Test cases for PromptCache
+def test_prompt_cache_persists_exact_prompts(tmp_path):
+    cache = PromptCache(tmp_path / "prompt_cache")
+    cache.add("prompt", {"answer": 1}, signature=("model", None, "tools"))
+    assert cache.lookup("prompt", signature=("model", None, "tools")) == {"answer": 1}
+    assert cache.lookup("prompt", signature=("model", None, "other")) is None
+    assert cache.lookup("prompt ", signature=("model", None, "tools")) is None
+    cache.close()
+    reopened = PromptCache(tmp_path / "prompt_cache")
+    assert reopened.lookup("prompt", signature=("model", None, "tools")) == {"answer": 1}
+    reopened.close()
+
+def test_lazy_import_of_missing_module_raises():
+    import pytest
+    from llm_utils import lazy_import
+    with pytest.raises(ModuleNotFoundError):
+        lazy_import("not_an_installed_module")
+
+def test_prompt_cache_ignores_the_time_of_day():
+    key = PromptCache.key
+    summary = "Portfolio Summary ({}):\nCash: 100.00\nTime: {} | Action: BUY AAPL"
+    assert key(summary.format("2026-10-15 09:30:00", "2026-10-15 09:29:58")) == key(summary.format("2026-10-15 16:00:01", "2026-10-15 15:59:59"))
+    assert key(summary.format("2026-10-15 09:30:00", "2026-10-15 09:29:58")) != key(summary.format("2026-10-16 09:30:00", "2026-10-16 09:29:58"))
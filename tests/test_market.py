@@ -0,0 +1,43 @@
+import sys
+import types
+import market
+
+
+def test_price_lookups_are_cached_within_ttl(monkeypatch):
+    requests = []
+    class FakeTicker:
+        def __init__(self, symbol):
+            requests.append(symbol)
+            self.info = {"currentPrice": 10.0 + len(requests)}
+    monkeypatch.setitem(sys.modules, "yfinance", types.SimpleNamespace(Ticker=FakeTicker))
+    market.clear_price_cache()
+    assert market.get_price_for_symbol("AAPL") == 11.0
+    assert market.get_price_for_symbol("AAPL") == 11.0
+    assert market.get_price_for_symbol("MSFT") == 12.0
+    assert requests == ["AAPL", "MSFT"]
+    fetched, price = market._price_cache["AAPL"]
+    market._price_cache["AAPL"] = (fetched - market.PRICE_CACHE_TTL, price)  # let the entry expire
+    assert market.get_price_for_symbol("AAPL") == 13.0
+    market.clear_price_cache()
+
+def test_get_prices_fetches_each_symbol_once(monkeypatch):
+    requests = []
+    def fake_price(symbol):
+        requests.append(symbol)
+        return {"AAPL": 10.0, "MSFT": 20.0}.get(symbol)
+    monkeypatch.setattr(market, "get_price_for_symbol", fake_price)
+    assert market.get_prices(["AAPL", "MSFT", "AAPL", "XXX"]) == {"AAPL": 10.0, "MSFT": 20.0, "XXX": None}
+    assert sorted(requests) == ["AAPL", "MSFT", "XXX"]
+    assert market.get_prices([]) == {}
+
+def test_concurrent_lookups_fill_the_bounded_cache(monkeypatch):
+    class FakeTicker:
+        def __init__(self, symbol):
+            self.info = {"currentPrice": 1.0 + int(symbol[1:])}
+    monkeypatch.setitem(sys.modules, "yfinance", types.SimpleNamespace(Ticker=FakeTicker))
+    monkeypatch.setattr(market, "PRICE_CACHE_MAXSIZE", 8)
+    market.clear_price_cache()
+    symbols = [f"S{i}" for i in range(200)]
+    assert market.get_prices(symbols) == {symbol: 1.0 + i for i, symbol in enumerate(symbols)}
+    assert len(market._price_cache) <= 8
+    market.clear_price_cache()
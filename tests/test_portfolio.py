@@ -73,3 +73,139 @@ def test_portfolio_transaction_history():
     assert len(history) == 2
     assert history[0]["type"] == "buy"
     assert history[1]["type"] == "sell"
+
+def test_portfolio_value_tracks_trades(monkeypatch):
+    prices = {"AAPL": 100.0, "GOOGL": 200.0}
+    monkeypatch.setattr("market.get_price_for_symbol", lambda symbol: prices[symbol])
+    portfolio = Portfolio()
+    portfolio.load_cash(1000)
+    portfolio.buy("AAPL", 300)
+    portfolio.buy("GOOGL", 200)
+    assert portfolio.portfolio_value == pytest.approx(1000)
+    prices["AAPL"] = 150.0
+    portfolio.update()
+    assert portfolio.portfolio_value == pytest.approx(1150)
+    portfolio.sell("AAPL", 150)
+    assert portfolio.portfolio_value == pytest.approx(1150)
+    portfolio.close_position("GOOGL")
+    assert portfolio.portfolio_value == pytest.approx(1150)
+    assert Portfolio.model_validate_json(portfolio.model_dump_json()).portfolio_value == pytest.approx(1150)
+
+def test_portfolio_update_matches_position_update(monkeypatch):
+    prices = {"AAPL": 100.0, "GOOGL": 200.0}
+    monkeypatch.setattr("market.get_price_for_symbol", lambda symbol: prices[symbol])
+    portfolio = Portfolio()
+    portfolio.load_cash(1000)
+    portfolio.buy("AAPL", 300)
+    portfolio.buy("GOOGL", 200)
+    expected = Position(**portfolio.positions["AAPL"].model_dump(exclude={"position_value"}))
+    prices.update(AAPL=120.0, GOOGL=180.0)
+    expected.update_position(120.0)
+    portfolio.update()
+    aapl = portfolio.positions["AAPL"]
+    assert aapl.last_update_price == 120.0
+    assert aapl.absolute_change_since_start == pytest.approx(expected.absolute_change_since_start)
+    assert aapl.relative_change_since_start == pytest.approx(expected.relative_change_since_start)
+    assert aapl.absolute_change_since_update == pytest.approx(expected.absolute_change_since_update)
+    assert aapl.relative_change_since_update == pytest.approx(expected.relative_change_since_update)
+    assert portfolio.positions["GOOGL"].absolute_change_since_start == pytest.approx(-20.0)
+    assert portfolio.absolute_change_since_update == pytest.approx(60.0 - 20.0)
+
+def test_portfolio_file_round_trip(monkeypatch, tmp_path):
+    monkeypatch.setattr("market.get_price_for_symbol", lambda symbol: 50.0)
+    portfolio = Portfolio()
+    portfolio.load_cash(500)
+    portfolio.buy("AAPL", 100)
+    portfolio.to_file(tmp_path / "portfolio.json")
+    loaded = Portfolio.from_file(tmp_path / "portfolio.json")
+    assert loaded.model_dump() == portfolio.model_dump()
+    assert loaded.transaction_history[0].symbol == "AAPL"
+
+def test_transaction_history_rendering_follows_new_transactions(monkeypatch):
+    monkeypatch.setattr("market.get_price_for_symbol", lambda symbol: 50.0)
+    portfolio = Portfolio()
+    portfolio.load_cash(500)
+    history = portfolio.transaction_history
+    assert str(history) == "No transactions recorded."
+    portfolio.buy("AAPL", 100)
+    assert str(history) == str(history[0])
+    portfolio.buy("MSFT", 50)
+    assert str(history) == "\n".join(str(txn) for txn in history)
+    history.clear()
+    portfolio.buy("GOOGL", 50)
+    assert str(history) == str(history[0])
+
+def test_portfolio_binary_file_round_trip(monkeypatch, tmp_path):
+    monkeypatch.setattr("market.get_price_for_symbol", lambda symbol: 50.0)
+    portfolio = Portfolio()
+    portfolio.load_cash(500)
+    portfolio.buy("AAPL", 100)
+    portfolio.to_file(tmp_path / "portfolio.pkl")
+    assert (tmp_path / "portfolio.pkl").read_bytes()[:1] == b"\x80"
+    loaded = Portfolio.from_file(tmp_path / "portfolio.pkl")
+    assert loaded.model_dump() == portfolio.model_dump()
+    assert loaded.portfolio_value == portfolio.portfolio_value
+
+def test_positions_rendering_follows_trades(monkeypatch):
+    prices = {"AAPL": 50.0, "MSFT": 20.0}
+    monkeypatch.setattr("market.get_price_for_symbol", lambda symbol: prices[symbol])
+    portfolio = Portfolio()
+    portfolio.load_cash(500)
+    portfolio.buy("AAPL", 100)
+    assert portfolio.positions_to_str() == str(portfolio.positions["AAPL"])
+    portfolio.buy("MSFT", 100)
+    prices["AAPL"] = 60.0
+    portfolio.update()
+    assert portfolio.positions_to_str() == "\n".join(str(position) for position in portfolio.positions.values())
+    portfolio.close_position("MSFT")
+    assert portfolio.positions_to_str() == str(portfolio.positions["AAPL"])
+
+def test_position_delta_kernel_matches_numpy():
+    import numpy as np
+    import _portfolio_kernels
+    rng = np.random.default_rng(0)
+    quantity, buy_price, last_update_price, new_price = rng.random((4, 16)) + 0.5
+    expected = _portfolio_kernels._compute_position_deltas_numpy(quantity, buy_price, last_update_price, new_price)
+    actual = _portfolio_kernels.compute_position_deltas(quantity, buy_price, last_update_price, new_price)
+    for expected_metric, actual_metric in zip(expected, actual):
+        assert np.allclose(expected_metric, actual_metric)
+
+def test_portfolio_as_frame(monkeypatch):
+    pytest.importorskip("pandas")
+    prices = {"AAPL": 50.0, "MSFT": 20.0}
+    monkeypatch.setattr("market.get_price_for_symbol", lambda symbol: prices[symbol])
+    portfolio = Portfolio()
+    portfolio.load_cash(500)
+    portfolio.buy("AAPL", 100)
+    portfolio.buy("MSFT", 60)
+    frame = portfolio.as_frame()
+    assert list(frame.index) == ["AAPL", "MSFT"]
+    assert list(frame["quantity"]) == pytest.approx([2.0, 3.0])
+    assert frame["position_value"].sum() + portfolio.available_cash == pytest.approx(portfolio.portfolio_value)
+
+def test_portfolio_rejects_non_positive_trade_values(monkeypatch, tmp_path):
+    monkeypatch.setattr("market.get_price_for_symbol", lambda symbol: 50.0)
+    portfolio = Portfolio()
+    portfolio.load_cash(500)
+    portfolio.buy("AAPL", 100)
+    for trade, value in ((portfolio.sell, -20), (portfolio.sell, 0), (portfolio.buy, -20), (portfolio.buy, 0)):
+        with pytest.raises(ValueError):
+            trade("AAPL", value)
+    assert portfolio.available_cash == pytest.approx(400)
+    assert portfolio.positions["AAPL"].quantity == pytest.approx(2)
+    assert len(portfolio.transaction_history) == 1
+    portfolio.to_file(tmp_path / "portfolio.json")
+    assert Portfolio.from_file(tmp_path / "portfolio.json").model_dump() == portfolio.model_dump()
+
+def test_portfolio_update_with_shared_prices(monkeypatch):
+    prices = {"AAPL": 50.0, "MSFT": 20.0}
+    monkeypatch.setattr("market.get_price_for_symbol", lambda symbol: prices[symbol])
+    portfolio = Portfolio()
+    portfolio.load_cash(500)
+    portfolio.buy("AAPL", 100)
+    portfolio.buy("MSFT", 100)
+    prices["MSFT"] = 30.0
+    portfolio.update(prices={"AAPL": 60.0})  # MSFT is not shared, so it is requested from the market
+    assert portfolio.positions["AAPL"].last_update_price == 60.0
+    assert portfolio.positions["MSFT"].last_update_price == 30.0
+    assert portfolio.portfolio_value == pytest.approx(300 + 120 + 150)
@@ -0,0 +1,323 @@
+import pytest
+import numpy as np
+import faiss
+from tinydb import TinyDB
+import memory.stores
+from memory.stores import EmbeddingsStore, MemoryIndex, EmbeddingCache, MemoryController
+from memory.memorymodel import Episode, Experience, Perception, Reflection
+from portfolio import Portfolio
+from datetime import datetime
+
+
+def random_embeddings(n, dimension=8, seed=0):
+    return np.random.default_rng(seed).random((n, dimension)).astype('float32')
+
+# Test cases for EmbeddingsStore
+def test_batch_search_matches_single_search(tmp_path):
+    store = EmbeddingsStore(index_path=tmp_path / "faiss_index.bin", dimension=8)
+    embeddings = random_embeddings(10)
+    for episode_id, embedding in enumerate(embeddings, start=1):
+        store.save_embedding(embedding, episode_id)
+    batch_ids, batch_distances = store.get_similar_embeddings_batch(embeddings[:3], best_k=2)
+    assert batch_ids.shape == (3, 2)
+    for row, embedding in enumerate(embeddings[:3]):
+        ids, distances = store.get_similar_embeddings(embedding, best_k=2)
+        assert list(ids) == list(batch_ids[row])
+        assert ids[0] == row + 1
+
+def test_index_is_reloaded_from_disk(tmp_path):
+    index_path = tmp_path / "faiss_index.bin"
+    store = EmbeddingsStore(index_path=index_path, dimension=8)
+    embeddings = random_embeddings(4)
+    for episode_id, embedding in enumerate(embeddings, start=1):
+        store.save_embedding(embedding, episode_id)
+    reloaded = EmbeddingsStore(index_path=index_path, dimension=8)
+    assert reloaded.ntotal == 4
+    reloaded.save_embedding(random_embeddings(1, seed=1)[0], 5)
+    ids, distances = reloaded.get_similar_embeddings(embeddings[2], best_k=1)
+    assert ids[0] == 3
+
+def test_store_migrates_to_ivf_above_threshold(tmp_path):
+    index_path = tmp_path / "faiss_index.bin"
+    store = EmbeddingsStore(index_path=index_path, dimension=8, ann_index_factory="IVF{nlist},Flat", ann_threshold=100, nprobe=4)
+    embeddings = random_embeddings(120)
+    for episode_id, embedding in enumerate(embeddings[:99], start=1):
+        store.save_embedding(embedding, episode_id)
+    assert not store.is_approximate()
+    for episode_id, embedding in enumerate(embeddings[99:], start=100):
+        store.save_embedding(embedding, episode_id)
+    assert store.is_approximate()
+    assert store.ntotal == 120
+    ids, distances = store.get_similar_embeddings(embeddings[110], best_k=1)
+    assert ids[0] == 111
+    reloaded = EmbeddingsStore(index_path=index_path, dimension=8, nprobe=4)
+    assert reloaded.is_approximate()
+    assert faiss.extract_index_ivf(reloaded.index).nprobe == 4
+
+def test_float32_index_is_upgraded_to_float16(tmp_path):
+    index_path = tmp_path / "faiss_index.bin"
+    store = EmbeddingsStore(index_path=index_path, dimension=8)
+    embeddings = random_embeddings(5)
+    for episode_id, embedding in enumerate(embeddings, start=1):
+        store.save_embedding(embedding, episode_id)
+    upgraded = EmbeddingsStore(index_path=index_path, dimension=8, embedding_dtype="float16")
+    assert isinstance(faiss.downcast_index(upgraded.index.index), faiss.IndexScalarQuantizer)
+    assert upgraded.ntotal == 5
+    ids, distances = upgraded.get_similar_embeddings(embeddings[3], best_k=1)
+    assert ids[0] == 4
+
+# Test cases for MemoryIndex
+def test_memory_index_imports_tinydb_with_ids(tmp_path):
+    legacy_path = tmp_path / "memory_index.json"
+    legacy_db = TinyDB(legacy_path)
+    legacy_db.insert_multiple([{"unique_id": "a"}, {"unique_id": "b"}, {"unique_id": "c"}])
+    legacy_db.remove(doc_ids=[2])
+    legacy_db.close()
+    memory_index = MemoryIndex(db_path=tmp_path / "memory_mapping.sqlite", legacy_path=legacy_path)
+    assert len(memory_index) == 2
+    assert memory_index.get_episode(3) == {"unique_id": "c"}
+    assert memory_index.get_episode(2) is None
+    assert [episode["unique_id"] for episode in memory_index.search_episodes('"unique_id": ?"[ac]"')] == ["a", "c"]
+    reopened = MemoryIndex(db_path=tmp_path / "memory_mapping.sqlite", legacy_path=legacy_path)
+    assert len(reopened) == 2
+
+# Test cases for EmbeddingCache
+def test_embedding_cache_only_embeds_new_texts(tmp_path, monkeypatch):
+    requests = []
+    def fake_embeddings(inputs, model):
+        requests.append(list(inputs))
+        return [[float(len(text)), 1.0] for text in inputs]
+    monkeypatch.setattr(memory.stores, "get_text_embeddings", fake_embeddings)
+    cache = EmbeddingCache(tmp_path / "embeddings_cache", model="model-a")
+    first = cache.get_embeddings(["a", "bb", "a"])
+    assert requests == [["a", "bb"]]
+    assert [list(embedding) for embedding in first] == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    reloaded = EmbeddingCache(tmp_path / "embeddings_cache", model="model-a")
+    reloaded.get_embeddings(["bb", "ccc"])
+    assert requests == [["a", "bb"], ["ccc"]]
+    EmbeddingCache(tmp_path / "embeddings_cache", model="model-b").get_embeddings(["a"])
+    assert requests[-1] == ["a"]
+
+def test_embedding_cache_is_bounded_and_persists_on_request(tmp_path, monkeypatch):
+    requests = []
+    def fake_embeddings(inputs, model):
+        requests.append(list(inputs))
+        return [[float(len(text)), 1.0] for text in inputs]
+    monkeypatch.setattr(memory.stores, "get_text_embeddings", fake_embeddings)
+    cache = EmbeddingCache(tmp_path / "embeddings_cache", model="model-a", max_size=2)
+    embeddings = cache.get_embeddings(["a", "bb", "ccc"], persist=False)
+    assert [list(embedding) for embedding in embeddings] == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert len(cache._embedding_cache) == 2
+    assert not list((tmp_path / "embeddings_cache").glob("*.npy"))
+    cache.get_embeddings(["dddd"])
+    assert len(list((tmp_path / "embeddings_cache").glob("*.npy"))) == 1
+    cache.get_embeddings(["a"], persist=False)  # evicted from memory and never persisted
+    assert requests[-1] == ["a"]
+
+def test_exact_search_matches_faiss_search(tmp_path):
+    embeddings = random_embeddings(30)
+    exact = EmbeddingsStore(index_path=tmp_path / "exact.bin", dimension=8)
+    indexed = EmbeddingsStore(index_path=tmp_path / "indexed.bin", dimension=8, exact_search_threshold=0)
+    for episode_id, embedding in enumerate(embeddings, start=1):
+        exact.save_embedding(embedding, episode_id)
+        indexed.save_embedding(embedding, episode_id)
+    queries = random_embeddings(4, seed=1)
+    exact_ids, exact_distances = exact.get_similar_embeddings_batch(queries, best_k=5)
+    indexed_ids, indexed_distances = indexed.get_similar_embeddings_batch(queries, best_k=5)
+    assert (exact_ids == indexed_ids).all()
+    assert np.allclose(exact_distances, indexed_distances, atol=1e-5)
+    few_ids, few_distances = EmbeddingsStore(index_path=tmp_path / "few.bin", dimension=8).get_similar_embeddings(queries[0], best_k=2)
+    assert list(few_ids) == [-1, -1]
+
+def test_new_embeddings_are_persisted_as_delta(tmp_path):
+    index_path = tmp_path / "faiss_index.bin"
+    store = EmbeddingsStore(index_path=index_path, dimension=8, delta_compaction_ratio=0.1)
+    embeddings = random_embeddings(23)
+    for episode_id, embedding in enumerate(embeddings[:20], start=1):
+        store.save_embedding(embedding, episode_id)
+    base_size = index_path.stat().st_size
+    store.save_embedding(embeddings[20], 21)
+    assert index_path.stat().st_size == base_size
+    assert store.delta_path.exists()
+    reloaded = EmbeddingsStore(index_path=index_path, dimension=8, delta_compaction_ratio=0.1)
+    assert reloaded.ntotal == 21
+    ids, distances = reloaded.get_similar_embeddings(embeddings[20], best_k=1)
+    assert ids[0] == 21
+    for episode_id, embedding in enumerate(embeddings[21:23], start=22):
+        reloaded.save_embedding(embedding, episode_id)
+    assert not reloaded.delta_path.exists()
+    assert EmbeddingsStore(index_path=index_path, dimension=8).ntotal == 23
+
+def test_mapped_ivf_index_accepts_new_embeddings(tmp_path):
+    index_path = tmp_path / "faiss_index.bin"
+    store = EmbeddingsStore(index_path=index_path, dimension=8, ann_index_factory="IVF{nlist},Flat", ann_threshold=100, nprobe=16)
+    embeddings = random_embeddings(105)
+    for episode_id, embedding in enumerate(embeddings[:100], start=1):
+        store.save_embedding(embedding, episode_id)
+    reloaded = EmbeddingsStore(index_path=index_path, dimension=8, nprobe=16)
+    for episode_id, embedding in enumerate(embeddings[100:], start=101):
+        reloaded.save_embedding(embedding, episode_id)
+    assert reloaded.is_approximate()
+    assert reloaded.index.ntotal == 100 and reloaded.ntotal == 105
+    ids, distances = reloaded.get_similar_embeddings_batch(embeddings[[5, 103]], best_k=1)
+    assert list(ids[:, 0]) == [6, 104]
+    for episode_id, embedding in enumerate(random_embeddings(6, seed=2), start=106):
+        reloaded.save_embedding(embedding, episode_id)
+    assert not reloaded.delta_path.exists()
+    assert reloaded.index.ntotal == 111 and reloaded.is_approximate()
+
+def test_store_migrates_to_hnsw_with_search_parameters(tmp_path):
+    index_path = tmp_path / "faiss_index.bin"
+    store = EmbeddingsStore(index_path=index_path, dimension=8, ann_index_factory="HNSW32", ann_threshold=50,
+                            ef_construction=100, ef_search=48)
+    embeddings = random_embeddings(60)
+    for episode_id, embedding in enumerate(embeddings, start=1):
+        store.save_embedding(embedding, episode_id)
+    assert store.is_approximate()
+    ids, distances = store.get_similar_embeddings(embeddings[42], best_k=1)
+    assert ids[0] == 43
+    reloaded = EmbeddingsStore(index_path=index_path, dimension=8, ef_search=48)
+    hnsw = faiss.downcast_index(reloaded.index.index).hnsw
+    assert hnsw.efSearch == 48 and hnsw.efConstruction == 100
+
+def test_delta_log_is_appended_and_tolerates_partial_records(tmp_path):
+    index_path = tmp_path / "faiss_index.bin"
+    store = EmbeddingsStore(index_path=index_path, dimension=8)
+    embeddings = random_embeddings(22)
+    for episode_id, embedding in enumerate(embeddings[:20], start=1):
+        store.save_embedding(embedding, episode_id)
+    store.save_embedding(embeddings[20], 21)
+    record_size = store.delta_path.stat().st_size
+    assert record_size == 8 + 8 * 4
+    store.save_embedding(embeddings[21], 22)
+    assert store.delta_path.stat().st_size == 2 * record_size
+    with open(store.delta_path, 'ab') as f:
+        f.write(b'\0' * 5)
+    reloaded = EmbeddingsStore(index_path=index_path, dimension=8)
+    assert reloaded.ntotal == 22
+    ids, distances = reloaded.get_similar_embeddings(embeddings[21], best_k=1)
+    assert ids[0] == 22
+
+def test_memory_index_batch_and_unique_id_lookup(tmp_path):
+    memory_index = MemoryIndex(db_path=tmp_path / "memory_mapping.sqlite")
+    with memory_index.db:
+        memory_index.db.executemany("INSERT INTO episodes (unique_id, payload) VALUES (?, ?)",
+                                    [(f"u{i}", f'{{"unique_id": "u{i}"}}') for i in range(1, 4)])
+    assert memory_index.get_episodes([3, 1, 3, 7]) == {3: {"unique_id": "u3"}, 1: {"unique_id": "u1"}}
+    assert memory_index.get_episodes([]) == {}
+    assert memory_index.get_episode_by_unique_id("u2") == {"unique_id": "u2"}
+    assert memory_index.get_episode_by_unique_id("missing") is None
+
+def test_embeddings_can_be_removed_by_episode_id(tmp_path):
+    index_path = tmp_path / "faiss_index.bin"
+    store = EmbeddingsStore(index_path=index_path, dimension=8, exact_search_threshold=0)
+    embeddings = random_embeddings(25)
+    for episode_id, embedding in enumerate(embeddings, start=1):
+        store.save_embedding(embedding, episode_id)
+    assert store.delta_path.exists()
+    assert store.remove_embeddings([3, 24, 99]) == 2
+    assert store.ntotal == 23 and not store.delta_path.exists()
+    ids, distances = store.get_similar_embeddings(embeddings[2], best_k=25)
+    assert 3 not in ids and 24 not in ids
+    assert EmbeddingsStore(index_path=index_path, dimension=8).get_similar_embeddings(embeddings[4], best_k=1)[0][0] == 5
+
+def test_store_migrates_to_product_quantized_ivf(tmp_path):
+    index_path = tmp_path / "faiss_index.bin"
+    store = EmbeddingsStore(index_path=index_path, dimension=32, ann_index_factory="IVF{nlist},PQ{m}", ann_threshold=300, nprobe=8)
+    embeddings = random_embeddings(300, dimension=32)
+    for episode_id, embedding in enumerate(embeddings, start=1):
+        store.save_embedding(embedding, episode_id)
+    base_index = faiss.downcast_index(store.index.index)
+    assert isinstance(base_index, faiss.IndexIVFPQ) and base_index.pq.M == 2
+    assert store.ntotal == 300
+    ids, distances = store.get_similar_embeddings(embeddings[123], best_k=10)
+    assert 124 in ids
+
+# Test cases for MemoryController
+def make_episode(news):
+    return Episode(experience=Experience(date=datetime(2025, 1, 2), perception=Perception(news_of_the_day=news, portfolio=Portfolio())))
+
+def test_current_episode_is_a_single_file_and_imports_tinydb(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    legacy_episodes = [make_episode(f"news {i}") for i in range(2)]
+    legacy_db = TinyDB(tmp_path / "agents" / "test" / "current_episode_store.json", create_dirs=True)
+    legacy_db.insert_multiple(episode.model_dump(mode="json") for episode in legacy_episodes)
+    legacy_db.close()
+    controller = MemoryController(agent_name="test")
+    assert not (tmp_path / "agents" / "test" / "current_episode_store.json").exists()
+    assert controller.get_current_episode().unique_id == legacy_episodes[-1].unique_id
+    episode = make_episode("today's news")
+    controller.save_current_episode(episode)
+    assert MemoryController(agent_name="test").get_current_episode().model_dump() == episode.model_dump()
+
+def test_float32_index_is_quantized_to_int8(tmp_path):
+    index_path = tmp_path / "faiss_index.bin"
+    store = EmbeddingsStore(index_path=index_path, dimension=8)
+    embeddings = random_embeddings(20)
+    for episode_id, embedding in enumerate(embeddings, start=1):
+        store.save_embedding(embedding, episode_id)
+    quantized = EmbeddingsStore(index_path=index_path, dimension=8, embedding_dtype="int8", exact_search_threshold=0)
+    assert faiss.downcast_index(quantized.index.index).sq.qtype == faiss.ScalarQuantizer.QT_8bit
+    assert quantized.ntotal == 20
+    ids, distances = quantized.get_similar_embeddings(embeddings[7], best_k=1)
+    assert ids[0] == 8
+
+def test_similar_episodes_batch_resolves_all_hits(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    vectors = {f"news {i}": np.eye(8, dtype='float32')[i] for i in range(3)}
+    monkeypatch.setattr(memory.stores, "get_text_embeddings",
+                        lambda inputs, model: [vectors[next(news for news in vectors if news in text)] for text in inputs])
+    controller = MemoryController(agent_name="test")
+    controller.embeddings_store = EmbeddingsStore(index_path=tmp_path / "faiss_index.bin", dimension=8)
+    episodes = [make_episode(f"news {i}") for i in range(3)]
+    for episode in episodes:
+        controller.save_finished_episode(episode)
+    similar = controller.get_similar_episodes_batch([episodes[2], episodes[0]], best_k=2)
+    assert [len(row) for row in similar] == [2, 2]
+    assert similar[0][0].unique_id == episodes[2].unique_id
+    assert similar[1][0].unique_id == episodes[0].unique_id
+
+def test_corrupt_index_is_not_replaced(tmp_path):
+    index_path = tmp_path / "faiss_index.bin"
+    index_path.write_bytes(b"not a faiss index")
+    with pytest.raises(RuntimeError):
+        EmbeddingsStore(index_path=index_path, dimension=8)
+    assert index_path.read_bytes() == b"not a faiss index"
+
+def test_legacy_l2_index_ranks_index_and_delta_by_distance(tmp_path):
+    index_path = tmp_path / "faiss_index.bin"
+    embeddings = random_embeddings(30)
+    legacy = faiss.IndexIDMap(faiss.IndexFlatL2(8))
+    legacy.add_with_ids(embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True), np.arange(1, 31, dtype='int64'))
+    faiss.write_index(legacy, str(index_path))
+    indexed = EmbeddingsStore(index_path=index_path, dimension=8, exact_search_threshold=0)
+    for episode_id, embedding in enumerate(random_embeddings(3, seed=2), start=31):
+        indexed.save_embedding(embedding, episode_id)
+    ids, distances = indexed.get_similar_embeddings(embeddings[5], best_k=3)
+    assert ids[0] == 6 and distances[0] == pytest.approx(0, abs=1e-5)
+    assert (np.diff(distances) >= 0).all()
+    exact = EmbeddingsStore(index_path=index_path, dimension=8)
+    exact_ids, exact_distances = exact.get_similar_embeddings(embeddings[5], best_k=3)
+    assert list(exact_ids) == list(ids)
+    assert np.allclose(exact_distances, distances, atol=1e-5)
+
+def test_reflection_copy_renders_updated_fields():
+    reflection = Reflection(expectation_evaluation="as expected", learning="old learning")
+    assert "old learning" in str(reflection)
+    updated = reflection.model_copy(update={"learning": "new learning"})
+    assert "new learning" in str(updated) and "old learning" not in str(updated)
+    assert "old learning" in str(reflection)
+    assert str(reflection.model_copy()) == str(reflection)
+
+def test_memory_controller_uses_configured_paths(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    agent_dir = tmp_path / "elsewhere" / "test"
+    file_paths = {'memory_mapping': str(agent_dir / 'memory_mapping.sqlite'),
+                  'memory_embeddings': str(agent_dir / 'faiss_index.bin'),
+                  'embeddings_cache': str(agent_dir / 'embeddings_cache'),
+                  'current_episode': str(agent_dir / 'current_episode.json')}
+    controller = MemoryController(agent_name="test", file_paths=file_paths)
+    controller.save_current_episode(make_episode("news"))
+    assert (agent_dir / 'current_episode.json').exists()
+    assert (agent_dir / 'embeddings_cache').is_dir()
+    assert not (tmp_path / "agents").exists()